@@ -1,15 +1,22 @@
 import pywikibot
 import mwparserfromhell
+from mwparserfromhell.nodes import Tag, Template, Text
+from mwparserfromhell.wikicode import Wikicode
 import wikitextparser as wtp
 import jsons
 import json
 import os
 import re
 import sys
+import hashlib
+import time
+from bisect import bisect_left, bisect_right
+from itertools import islice
 from tqdm import tqdm
-from datetime import date
+from datetime import date, timedelta
 from iteration_utilities import unique_everseen
 from wiki_banner_fixes import BANNER_NAME_CHANGE, CORRECT_DATES_JP, CORRECT_DATES_NA
+from wiki_fetch import category_members, fetch_init, get_page, load_pages, normalize_title, recent_changes, replaying, save_page_cache, server_time
 from django.utils.text import slugify
 
 # Define format of progress bar.
@@ -55,6 +62,11 @@ REMOVE_MATCHES = (
     "New Servant Interlude",
 )
 
+# LINK_MATCHES (sections to parse) and REMOVE_MATCHES (sections to skip) compiled once
+SECTION_PATTERNS = [(re.compile(string), True) for string in LINK_MATCHES] + [(re.compile(string), False) for string in REMOVE_MATCHES]
+# Matches wherever any of the keywords match, to find where sections start in a single scan
+SECTION_START = re.compile('|'.join(f'(?:{string})' for string in LINK_MATCHES + REMOVE_MATCHES))
+
 # Pages that should not be parsed nor merged into.
 # TODO: Rework this to automatically remove GSSRs when parsing titles
 EXCLUDE_PAGES = (
@@ -106,6 +118,11 @@ PRIORITY_REMOVE_MATCHES = (
     r"==New \[\[Friend Point\]\] Gacha Servants==",
 )
 
+# PAGE_FIXES compiled once
+PAGE_FIX_PATTERNS = {title : (re.compile(pattern), replace) for title, (pattern, replace) in PAGE_FIXES.items()}
+# Matches any of the PRIORITY_REMOVE_MATCHES keywords, so the text is cut at the first one in a single scan
+PRIORITY_REMOVE = re.compile('|'.join(f'(?:{string})' for string in PRIORITY_REMOVE_MATCHES))
+
 # Pages with wikitables that can generate false positives so table-style parsing should be skipped.
 SKIP_TABLE_PARSE_PAGES = (
     "Prisma Codes Collaboration Event (US)/Summoning Campaign",
@@ -129,6 +146,21 @@ TABLE_MATCHES = (
     "Edmond Dantès]] {{LimitedS}}\n|{{Avenger}}\n|-\n|4{{Star}}\n|{{Gilgamesh (Caster)", # Servant Summer Festival! 2018/Event Info
 )
 
+# Matches the name in every template and wikilink, such as {{Servant}} or [[Servant|...]]
+SERVANT_REF = re.compile(r'(?:{{|\[\[)\s*([^{}\[\]|\n]+?)\s*(?=\||}}|\]\])')
+
+# Matches any of the TABLE_MATCHES keywords
+TABLE_KEYWORDS = re.compile('|'.join(re.escape(string) for string in TABLE_MATCHES))
+
+# Title line of a summoning campaign tab, with the first line of the tab's content if it's on the same line
+# Example: "Summoning Campaign 2=" or "Summoning Campaign 2={{Banner}}"
+TAB_TITLE = re.compile(r'(.*Summo.*(?:\w|\)))=((?:\[\[|{{|{\|).*)?')
+# The content of a summoning campaign tab starts with a link, template or wikitable
+TAB_CONTENT_START = ('[[', '{{', '{|')
+# Duration line of a summoning campaign tab
+# Example: "'''Duration:''' March 1 ~ March 10"
+TAB_DURATION = re.compile(r'.*Duration.*?(?: |\'|:)([A-Z].*)')
+
 # Servant names that are incorrect on the wiki that should be fixed.
 NAME_FIXES = {
     'Attila' : 'Altera', # FGO Summer Festival 2016 ~1st Anniversary~
@@ -350,6 +382,27 @@ BANNER_NAME_FIX = {
     r"Campaigns" : "Campaign",
 }
 
+# BANNER_NAME_FIX compiled once, as (pattern, replacement, number of banners to skip at the start of each event)
+BANNER_NAME_RULES = []
+for original, replace in BANNER_NAME_FIX.items():
+    # "<SKIP#>string_to_replace" skips the first # banners of each event
+    skip = 0
+    if original.startswith("<SKIP"):
+        skip, original = original[5:].split(">", 1)
+        skip = int(skip)
+    BANNER_NAME_RULES.append((re.compile(original), replace, skip))
+# Matches any of the BANNER_NAME_FIX patterns, so banners that none of them match are skipped in a single search
+BANNER_NAME_ANY = re.compile('|'.join(f'(?:{pattern.pattern})' for pattern, _, _ in BANNER_NAME_RULES))
+
+# BANNER_NAME_CHANGE keyed by event and banner name, with the new names of every banner with that name in order
+BANNER_NAME_CHANGES = {}
+for event, target_banner, change in BANNER_NAME_CHANGE:
+    BANNER_NAME_CHANGES.setdefault((event, target_banner), []).append(change)
+# Each banner is only renamed once, so a new name can't be renamed again by another change
+for event, target_banner, change in BANNER_NAME_CHANGE:
+    if change == target_banner or (event, change) in BANNER_NAME_CHANGES:
+        raise ValueError(f'Banner name change of "{target_banner}" in "{event}" to "{change}" is renamed again')
+
 # NOTE: Used by parse_event_lists()
 # Skip parsing certain dates in event list (pre-2023)
 SKIP_DATES = {
@@ -433,6 +486,53 @@ EVENT_LIST_NA = (
     "Event List (US)/2025 Events",
 )
 
+# NOTE: Used by load_banner_state() and save_banner_state()
+# File holding the event sets of the last build, used by incremental builds
+BANNER_STATE_FILE = 'banner_state.json'
+
+# Files that change the parsed event sets when edited, forcing a full build
+BANNER_STATE_INPUTS = (
+    'servant_details.json',
+    'wiki_banners.py',
+    'wiki_banner_fixes.py',
+)
+
+# Number of days of edits kept in the wiki's recent changes
+RECENT_CHANGES_MAX_AGE = 30
+
+class Rateup:
+    """
+    Immutable, hashable set of rateup servants, stored as their IDs in sorted order.
+    """
+    __slots__ = ('ids', '_hash')
+
+    def __init__(self, ids):
+        self.ids = tuple(sorted(set(ids)))
+        self._hash = hash(self.ids)
+
+    def __hash__(self):
+        return self._hash
+
+    def __eq__(self, other):
+        return isinstance(other, Rateup) and self._hash == other._hash and self.ids == other.ids
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        return iter(self.ids)
+
+    # Merge two rateups into one with the servants of both
+    def __or__(self, other):
+        return Rateup(self.ids + other.ids)
+
+    def isdisjoint(self, other):
+        return set(self.ids).isdisjoint(other.ids)
+
+    # Get the name of every servant by ID, for exporting
+    def names(self):
+        return {servant_id : SERVANT_IDS[servant_id] for servant_id in self.ids}
+
 class Event:
     def __init__(self, name, region, image_file, banners):
         self.name = name
@@ -451,6 +551,21 @@ class Event:
     
     def __eq__(self, other):
         return str(self) == str(other)
+
+    # Map each rateup to the index of the first banner with it
+    def rateup_index(self):
+        index = {}
+        for i, banner in enumerate(self.banners):
+            index.setdefault(banner.rateups, i)
+        return index
+
+class EventStore(dict):
+    """
+    Events in the order they were parsed, each keyed by itself so events can also be looked up by name.
+    """
+    # Get the last k events, most recent first, without copying the whole store
+    def last(self, k):
+        return list(islice(reversed(self.values()), k))
     
 class Banner:
     def __init__(self, name, start_date, end_date, date_origin, rateups):
@@ -469,23 +584,34 @@ class Banner:
 
 SERVANT_DATA = None # Servant data
 SERVANT_NAMES = None # Servant data
+SERVANT_IDS = None # Servant name of each servant ID
+SERVANT_REF_NAMES = None # Servant name and ID of every name a servant can be referred to by, including NAME_FIXES
 DIR_PATH = None # Path to the directory of this file
-SITE = None # Wiki site
-EVENT_SET_JP = {} # Dictionary of banners for JP
-EVENT_SET_NA = {} # Dictionary of banners for NA
+EVENT_SET_JP = EventStore() # Dictionary of banners for JP
+EVENT_SET_NA = EventStore() # Dictionary of banners for NA
 PAGES_VISITED = set() # Set of pages visited
+EVENT_LIST_PAGES = set() # Set of pages read while parsing the current event list, including pages visited before it
+PARSED_PAGES = {} # Text, wikicode and templates of each page parsed during this run, keyed by title and revision ID
 CURRENT_YEAR = 0 # Current year
 CURRENT_REGION = "" # Current region
 PRESENT_YEAR = 2025
+BUILD_TIMESTAMP = None # Time the current build started
+BANNER_STATE = {"JP" : {}, "NA" : {}} # Snapshots of the event sets after each event list
+PAGE_TIMINGS = None # Seconds spent on each stage of processing each page, if timings are enabled
 
-def banner_init():
+def banner_init(timings=False):
     global SERVANT_DATA
     global SERVANT_NAMES
+    global SERVANT_IDS
+    global SERVANT_REF_NAMES
     global DIR_PATH
-    global SITE
+    global PAGE_TIMINGS
 
     DIR_PATH = os.path.dirname(__file__) # Path to the directory of this file
-    SITE = pywikibot.Site() # Wiki site
+    fetch_init()
+
+    # Keep track of the time spent on each page
+    PAGE_TIMINGS = {} if timings else None
 
     # Import the servant data.
     with open(os.path.join(DIR_PATH, 'servant_details.json')) as f:
@@ -493,6 +619,10 @@ def banner_init():
 
     # Get the names and IDs of all the servants.
     SERVANT_NAMES = {servant['name'] : int(servant['id']) for servant in SERVANT_DATA}
+    SERVANT_IDS = {id : name for name, id in SERVANT_NAMES.items()}
+    # Include the names that are incorrect on the wiki.
+    SERVANT_REF_NAMES = {name : (id, name) for name, id in SERVANT_NAMES.items()}
+    SERVANT_REF_NAMES.update({name : SERVANT_REF_NAMES[fix] for name, fix in NAME_FIXES.items() if fix in SERVANT_REF_NAMES})
 
 # Parse the raw date range strings into date objects
 def date_parser(start_date, end_date, year):
@@ -542,10 +672,181 @@ def date_splitter(date_str):
     
     return date_split
 
+# Add the time since start to the time spent on a stage of processing a page
+def record_timing(title, stage, start):
+    if PAGE_TIMINGS is not None:
+        stages = PAGE_TIMINGS.setdefault(title, {})
+        stages[stage] = stages.get(stage, 0) + time.perf_counter() - start
+
+# Print the pages that took the longest to process
+def report_timings(num_pages=20):
+    if not PAGE_TIMINGS:
+        return
+    stages = sorted({stage for page_stages in PAGE_TIMINGS.values() for stage in page_stages})
+    totals = {stage : sum(page_stages.get(stage, 0) for page_stages in PAGE_TIMINGS.values()) for stage in stages}
+    print(f"Time spent on {len(PAGE_TIMINGS)} pages: " + ", ".join(f"{stage} {total:.2f}s" for stage, total in totals.items()))
+    print(f"Slowest {num_pages} pages:")
+    for title, page_stages in sorted(PAGE_TIMINGS.items(), key=lambda item: sum(item[1].values()), reverse=True)[:num_pages]:
+        print(f"  {sum(page_stages.values()):.3f}s {title} (" + ", ".join(f"{stage} {page_stages[stage]:.3f}s" for stage in stages if stage in page_stages) + ")")
+
+# Remove HTML comments in a single pass. Unterminated comments are kept, the same as with re.sub(r'<!--(.|\n)*?-->', '', text).
+def remove_comments(text):
+    parts = []
+    index = 0
+    while True:
+        start = text.find('<!--', index)
+        if start == -1:
+            break
+        end = text.find('-->', start + 4)
+        if end == -1:
+            break
+        parts.append(text[index:start])
+        index = end + 3
+    parts.append(text[index:])
+    return ''.join(parts)
+
+# Get the text of a page with its HTML comments removed
+def get_page_text(page):
+    key = (page.title(), page.revid)
+    if key not in PARSED_PAGES:
+        start = time.perf_counter()
+        # The page is only parsed once the wikicode is needed
+        PARSED_PAGES[key] = [remove_comments(page.text), None, None]
+        record_timing(page.title(), 'comments', start)
+    return PARSED_PAGES[key][0]
+
+# Parse a page with its HTML comments removed, reusing the parsed page if the same revision was already parsed
+def parse_page(page):
+    text = get_page_text(page)
+    parsed = PARSED_PAGES[(page.title(), page.revid)]
+    if parsed[1] is None:
+        start = time.perf_counter()
+        parsed[1] = mwparserfromhell.parse(text)
+        parsed[2] = parsed[1].filter_templates()
+        record_timing(page.title(), 'parse', start)
+    return tuple(parsed)
+
+# Find every servant referred to by a template or wikilink in the text, without parsing it.
+# Returns a list of (index, servant ID, servant name) in order of the indexes.
+def find_servant_refs(text):
+    refs = []
+    for match in SERVANT_REF.finditer(text):
+        if match.group(1) in SERVANT_REF_NAMES:
+            refs.append((match.start(), *SERVANT_REF_NAMES[match.group(1)]))
+    return refs
+
+# Get the title, first line of content and duration of a summoning campaign tab, or None if it isn't one
+def parse_tab(tab_text):
+    lines = tab_text.split('\n')
+    i = 0
+    # Skip the blank lines before the title
+    while i < len(lines) and not lines[i]:
+        i += 1
+    if i == len(lines):
+        return None
+    match = TAB_TITLE.fullmatch(lines[i])
+    if not match:
+        return None
+    tab_title, content = match.groups()
+
+    # If the content isn't on the title line, it starts on the next line that isn't blank
+    if content is None:
+        i += 1
+        while i < len(lines) and not lines[i]:
+            i += 1
+        if i == len(lines) or not lines[i].startswith(TAB_CONTENT_START):
+            return None
+        content = lines[i]
+
+    # The duration is on the next line after the first line of content that isn't blank
+    duration = None
+    i += 1
+    while i < len(lines) and not lines[i]:
+        i += 1
+    if i < len(lines):
+        match = TAB_DURATION.match(lines[i])
+        if match:
+            duration = match.group(1)
+    return tab_title, content, duration
+
+# Find every summoning campaign tab in the tabbers of a page, in order.
+# Returns a list of (tab title, first line of content, duration) with the duration set to None if the tab has none.
+def find_tabs(wikicode):
+    tabs = []
+    # Nodes inside the tabbers that have already been walked
+    walked = set()
+    for node in wikicode.filter(forcetype=(Tag, Template)):
+        if id(node) in walked:
+            continue
+        # <tabber>Tab 1=...|-|Tab 2=...</tabber>
+        if isinstance(node, Tag):
+            if str(node.tag).strip().lower() != 'tabber' or node.self_closing:
+                continue
+            # Split the tabber into tabs, keeping the nodes of each tab that may contain nested tabbers
+            tab_texts = [['', []]]
+            for child in node.contents.nodes:
+                if isinstance(child, Text):
+                    parts = child.value.split('|-|')
+                    tab_texts[-1][0] += parts[0]
+                    tab_texts.extend([part, []] for part in parts[1:])
+                else:
+                    tab_texts[-1][0] += str(child)
+                    tab_texts[-1][1].append(child)
+        # {{#tag:tabber|Tab 1=...{{!}}-{{!}}Tab 2=...}}
+        else:
+            if str(node.name).strip().lower() != '#tag:tabber':
+                continue
+            # The tabs may have been parsed as named parameters, so rejoin the parameters
+            tab_texts = [[text, []] for text in '|'.join(str(param) for param in node.params).split('{{!}}-{{!}}')]
+
+        for tab_text, children in tab_texts:
+            tab = parse_tab(tab_text)
+            if tab:
+                tabs.append(tab)
+            # The tabs of any tabbers nested in the tab come right after it
+            if children:
+                tabs.extend(find_tabs(Wikicode(children)))
+        walked.update(id(child) for child in Wikicode([node]).filter(forcetype=(Tag, Template)))
+    return tabs
+
+# Add the banners of a page to its event, creating the event if needed
+def add_banners(event_set, title, banners, parent=None, image_file=None):
+    # Check if the event is a subsequent Summoning Campaign that can be merged into a Chapter Release event
+    chapter_release_title = f'{title.split("Summoning Campaign")[0].strip()} Chapter Release'
+    if chapter_release_title in event_set or chapter_release_title + " (US)" in event_set:
+        if chapter_release_title + " (US)" in event_set:
+            chapter_release_title += " (US)"
+        # Get the rateups of the chapter release
+        chapter_release_rateups = event_set[chapter_release_title].rateup_index()
+
+        # Check if each rateup list is already in the Chapter Release event
+        for banner in banners:
+            # If the rateup is already in the Chapter Release event...
+            if banner.rateups in chapter_release_rateups:
+                # Get the index of the rateup in the Chapter Release event
+                dest_i = chapter_release_rateups[banner.rateups]
+
+                # Transfer date duration and rateup title over
+                event_set[chapter_release_title].banners[dest_i].copy_metadata(banner)
+            # If the rateup list is not already in the Chapter Release event, add it
+            else:
+                event_set[chapter_release_title].banners.append(banner)
+    # If the banner already has a predetermined parent, add it to that parent
+    elif parent:
+        # If the parent event already exists, add the banners to it
+        try:
+            event_set[parent].banners.extend(banners)
+        # If the parent event does not exist, create it
+        except KeyError:
+            new_event = Event(parent, CURRENT_REGION, image_file, banners)
+            event_set[new_event] = new_event
+    # If the event is not in the set, add it
+    else:
+        new_event = Event(title, CURRENT_REGION, image_file, banners)
+        event_set[new_event] = new_event
+
 def get_header_info(page):
-    text = page.text
-    wikicode = mwparserfromhell.parse(text)
-    templates = wikicode.filter_templates()
+    _, _, templates = parse_page(page)
     header_idx = None
 
     # Check template 1 or 2 for the header
@@ -581,26 +882,39 @@ def get_header_info(page):
 # Parse an FGO wiki page
 def parse(event_set, page, duration, parent=None, image_file=None):
     # Finds indexes of matching keywords in order to breaks link-style pages into chunks, each with a rateup.
+    # Returns a list of (index, whether to parse the section) in order of the indexes.
     def create_text_splits(text):
         splits = {}
-
-        # Find index of keywords that indicate a rateup coming after.
-        for string in LINK_MATCHES:
-            matches = re.finditer(string, text)
-            # Mark it to be preserved.
-            for match in matches:
-                splits[match.start()] = True
-        
-        # Find index of keywords that are before sections causing false positives.
-        for string in REMOVE_MATCHES:
-            matches = re.finditer(string, text)
-            # Mark it to be removed.
-            for match in matches:
-                splits[match.start()] = False
-        
-        # Sort the indexes of the splits and return it.
-        splits = {k: v for k, v in sorted(splits.items(), key=lambda item: item[0], reverse=True)}
-        return splits
+        # Where the last match of each keyword ended, since the matches of a keyword can't overlap
+        last_ends = [0] * len(SECTION_PATTERNS)
+
+        # Visit every index where any keyword matches
+        start_match = SECTION_START.search(text)
+        while start_match:
+            index = start_match.start()
+            for i, (pattern, keep) in enumerate(SECTION_PATTERNS):
+                if index < last_ends[i]:
+                    continue
+                match = pattern.match(text, index)
+                if match:
+                    last_ends[i] = match.end()
+                    # Keywords that indicate a rateup coming after are preserved, unless a keyword before a section
+                    # causing false positives matches at the same index.
+                    splits[index] = splits.get(index, True) and keep
+            start_match = SECTION_START.search(text, index + 1)
+
+        return sorted(splits.items())
+
+    # Find where each link starts and ends in the text, in order.
+    def find_link_spans(text, links):
+        spans = []
+        index = 0
+        for link in links:
+            # Links are listed in the order they appear, with nested links after the links containing them
+            start = text.find(str(link), index)
+            spans.append((start, start + len(str(link)), link))
+            index = start + 1
+        return spans
 
     # Fix any errors in the servant name.
     def correct_name(name):
@@ -609,46 +923,62 @@ def parse(event_set, page, duration, parent=None, image_file=None):
         return name
 
     def parse_wikilinks(links):
-        # Initialize the list of rateup servants.
-        rateup_servants = {}
+        # Initialize the set of rateup servant IDs.
+        rateup_servants = set()
 
         # Check every link to see if it is a valid servant name.
         for link in links:
             # Fix any errors in the servant name
             name = correct_name(str(link.title).strip())
-            # Add the servant name and ID to the dictionary of rateup servants if it is a valid servant name.
+            # Add the servant ID to the set of rateup servants if it is a valid servant name.
             if name in SERVANT_NAMES:
-                rateup_servants[SERVANT_NAMES[name]] = name
+                rateup_servants.add(SERVANT_NAMES[name])
 
         # If rateup servants were found...
         if rateup_servants:
             # Sort and dedupe the servants.
-            return dict(sorted(rateup_servants.items()))
+            return Rateup(rateup_servants)
 
     # Get the title of the page
     title = page.title()
     PAGES_VISITED.add(title)
+    EVENT_LIST_PAGES.add(title)
 
     # Do not parse explicitly excluded pages and user blogs.
     if title in EXCLUDE_PAGES or (title in EXCLUDE_PAGES_WITH_PARENT and parent == EXCLUDE_PAGES_WITH_PARENT[title]) or title.startswith("User blog:"):
         return
 
-    # Get contents of the page and remove HTML comments
-    text = re.sub(r'<!--(.|\n)*?-->', '', page.text)
+    # Get contents of the page without HTML comments
+    page_text = get_page_text(page)
+    text = page_text
+    start = time.perf_counter()
 
     # Apply any explicitly defined fixes
-    if title in PAGE_FIXES:
-        text = re.sub(PAGE_FIXES[title][0], PAGE_FIXES[title][1], text)
-
-    # Find and apply any priority text removals
-    for string in PRIORITY_REMOVE_MATCHES:
-        matches = re.finditer(string, text)
-        # Remove the match and everything after it
-        for match in matches:
-            text = text[:match.start()]
+    if title in PAGE_FIX_PATTERNS:
+        pattern, replace = PAGE_FIX_PATTERNS[title]
+        text = pattern.sub(replace, text)
+
+    # Find the first priority text removal and remove the match and everything after it
+    match = PRIORITY_REMOVE.search(text)
+    if match:
+        text = text[:match.start()]
+
+    # Pages that don't refer to any servants can't have rateups, so skip parsing them
+    if not find_servant_refs(text) and title not in RATEUP_FIXES:
+        add_banners(event_set, title, [], parent, image_file)
+        record_timing(title, 'preprocess', start)
+        return
+    record_timing(title, 'preprocess', start)
 
-    # Parse the page contents
-    wikicode = mwparserfromhell.parse(text)
+    # Parse the page contents, reusing the parsed page unless the contents were changed
+    if text == page_text:
+        _, wikicode, page_templates = parse_page(page)
+    else:
+        start = time.perf_counter()
+        wikicode = mwparserfromhell.parse(text)
+        page_templates = wikicode.filter_templates()
+        record_timing(title, 'parse', start)
+    start = time.perf_counter()
 
     # Initialize the list of rateups
     rateups = []
@@ -669,21 +999,18 @@ def parse(event_set, page, duration, parent=None, image_file=None):
                 class_type = None
 
             # 2. The "class" field must contain "wikitable".
+            if class_type != 'wikitable' and class_type != 'fandom-table':
+                continue
             # 3. The tag must contain at least one keyword indicating that it is a rateup servants wikitable.
-            has_valid_class = class_type == 'wikitable' or class_type == 'fandom-table'
-            has_valid_keyword = any([x in tag for x in TABLE_MATCHES])
-            if not has_valid_class or not has_valid_keyword:
+            if not TABLE_KEYWORDS.search(str(tag)):
                 continue
 
-            # Parse the tag
-            table = mwparserfromhell.parse(tag)
-
-            # Get all the templates in the tag.
+            # Get all the templates in the tag, which is already parsed.
             # Example: "{{wikipage}}""
-            templates = table.filter_templates()
+            templates = Wikicode([tag]).filter_templates()
 
-            # Initialize the list of rateup servants.
-            rateup_servants = {}
+            # Initialize the set of rateup servant IDs.
+            rateup_servants = set()
 
             # Get the rateup servants from the templates
             # Example: "{{servant_name}}"
@@ -691,44 +1018,38 @@ def parse(event_set, page, duration, parent=None, image_file=None):
                 # Fix any errors in the servant name
                 name = correct_name(str(template.name))
 
-                # Add the servant name and ID to the dictionary of rateup servants if it is a valid servant name, with ID as the key
+                # Add the servant ID to the set of rateup servants if it is a valid servant name
                 if name in SERVANT_NAMES:
-                    rateup_servants[SERVANT_NAMES[name]] = name
+                    rateup_servants.add(SERVANT_NAMES[name])
             
             # Manually add any rateup servants that are incorrectly left out of the table on the wiki
             if title in RATEUP_FIXES:
-                rateup_servants[SERVANT_NAMES[RATEUP_FIXES[title]]] = RATEUP_FIXES[title]
+                rateup_servants.add(SERVANT_NAMES[RATEUP_FIXES[title]])
 
             # If rateup servants were found in the wikitables...
             if rateup_servants:
-                # Sort the servants by ID.
-                rateup_servants = dict(sorted(rateup_servants.items()))
-                # Append to the list of rateups.
-                rateups.append(rateup_servants)
+                # Append to the list of rateups, sorted by ID.
+                rateups.append(Rateup(rateup_servants))
 
                 # If the rateup that was just added and the previous rateup have any servants in common, merge the new one into the previous one.
                 # Also, merge any rateups that are forced to be merged.
                 # Don't merge if the whole page is marked not to be merged or a specific rateup is marked not to be merged.
                 if len(rateups) > 1 \
                     and (title in FORCE_MERGE \
-                         or (len(set(rateups[-2].keys()).intersection(set(rateups[-1].keys()))) > 0 \
+                         or (not rateups[-2].isdisjoint(rateups[-1]) \
                              and not (title in NO_MERGE and num_parsed in NO_MERGE[title]))):
                     # Merge the new banner into the previous one.
-                    rateups[-2].update(rateups[-1])
-                    # Sort the servants by ID.
-                    rateups[-2] = dict(sorted(rateups[-2].items()))
+                    rateups[-2] = rateups[-2] | rateups[-1]
                     # Remove the new banner since it's been merged into the previous one.
                     del rateups[-1]
 
                     # Check if the newly merged banner can be merged again to the new previous banner
                     # Don't do this second merge if explicitly marked not to
                     if len(rateups) > 1 \
-                        and len(set(rateups[-2].keys()).intersection(set(rateups[-1].keys()))) > 0 \
+                        and not rateups[-2].isdisjoint(rateups[-1]) \
                         and title not in NO_MERGE:
                         # Merge the new banner into the previous one.
-                        rateups[-2].update(rateups[-1])
-                        # Sort the servants by ID.
-                        rateups[-2] = dict(sorted(rateups[-2].items()))
+                        rateups[-2] = rateups[-2] | rateups[-1]
                         # Remove the new banner since it's been merged into the previous one
                         del rateups[-1]
 
@@ -748,41 +1069,33 @@ def parse(event_set, page, duration, parent=None, image_file=None):
             rateup_servants = parse_wikilinks(links)
             # If rateup servants were found...
             if rateup_servants:
-                # Sort the servants by ID.
-                rateup_servants = dict(sorted(rateup_servants.items()))
                 # Append the rateup to the start of the rateups list.
                 rateups.insert(0, rateup_servants)
 
         # If the page is not marked as priority, look for keywords and parse servants if found.
         elif not rateups and title not in PRIORITY_PAGES:
-            links = []
             # Get the indexes that indicate sections of the text to parse and sections to skip.
             splits = create_text_splits(text)
-            
-            # Base text will hold the remaining part of the page that hasn't been parsed yet.
-            base_text = text
-            # Go through each index from the bottom of the page to the top.
-            for key, value in splits.items():
-                # Parse (or skip) the text between the current index and the remaining part of the page.
-                parse_text = base_text[key:]
-                # Save the remaining part of the page that hasn't been parsed yet for the next iteration.
-                base_text = base_text[:key]
+            # Get where each link in the page is.
+            link_spans = find_link_spans(text, wikicode.filter_wikilinks())
+            link_starts = [start for start, _, _ in link_spans]
+
+            # Go through each section from the top of the page to the bottom.
+            for i, (key, value) in enumerate(splits):
                 # If the section is marked to be removed, skip it.
                 if not value:
                     continue
-                # Parse the section.
-                sub_wikicode = mwparserfromhell.parse(parse_text)
-                # Get all the links in the section.
-                links = sub_wikicode.filter_wikilinks()
+                # The section ends where the next section starts.
+                end = splits[i + 1][0] if i + 1 < len(splits) else len(text)
+                # Get all the links entirely inside the section.
+                links = [link for start, link_end, link in link_spans[bisect_left(link_starts, key):bisect_left(link_starts, end)] if link_end <= end]
 
                 # Find rateup servants.
                 rateup_servants = parse_wikilinks(links)
                 # If rateup servants were found...
                 if rateup_servants:
-                    # Sort the servants by ID.
-                    rateup_servants = dict(sorted(rateup_servants.items()))
-                    # Append the rateup to the start of the rateups list (since the page is parsed backwards).
-                    rateups.insert(0, rateup_servants)
+                    # Append the rateup to the end of the rateups list.
+                    rateups.append(rateup_servants)
 
     # Dedupe the rateups.
     rateups = list(unique_everseen(rateups))
@@ -803,7 +1116,7 @@ def parse(event_set, page, duration, parent=None, image_file=None):
     date_origin = "event list"
 
     # Parse dates from pages with new-style event headers
-    templates = wikicode.filter_templates()
+    templates = page_templates
     if len(templates) > 0 and (templates[0].name.strip() == "EventHeaderJP" or templates[0].name.strip() == "EventHeaderNA"):
         # Get the raw start date
         start_date_str = templates[0].get("start").value.strip()
@@ -852,22 +1165,22 @@ def parse(event_set, page, duration, parent=None, image_file=None):
     date_origins = [date_origin] * len(rateups)
 
     # Finds dates and banner titles on pages with multiple summoning campaigns on different tabs
-    matches = re.findall(r'(.*Summo.*(?:\w|\)))=\n*((?:\[\[|{{|{\|).*)\n\n*(?:.*Duration.*?(?: |\'|:)([A-Z].*))?', text)
+    tabs = find_tabs(wikicode) if 'tabber' in text and title not in FAKE_BANNERS else []
 
     # Check every found summoning campaign tab
     i = 0
-    for match in matches:
+    for tab_title, content, tab_duration in tabs:
+        # Stop once every banner has been matched to a tab
+        if i >= len(rateups):
+            break
         # Cut out GSSR tabs, CE-only banners, and parent tabs of summoning campaign tabs
-        if "Lucky" not in match[0] and "Guaranteed" not in match[0] and title not in FAKE_BANNERS and "tabber" not in match[1]:
-            # Update the banner title by merging the original banner title with the tab text if possible.
-            try:
-                rateup_titles[i] = f'{subpage_title} {match[0].strip()}'
-            except:
-                pass
+        if "Lucky" not in tab_title and "Guaranteed" not in tab_title and "tabber" not in content:
+            # Update the banner title by merging the original banner title with the tab text.
+            rateup_titles[i] = f'{subpage_title} {tab_title.strip()}'
 
             # Update the duration if a new duration was found
-            if match[2]:
-                date_split = date_splitter(match[2])
+            if tab_duration:
+                date_split = date_splitter(tab_duration)
                 dates[i] = date_parser(date_split[0], date_split[1], CURRENT_YEAR)
                 date_origins[i] = "tab"
 
@@ -877,121 +1190,74 @@ def parse(event_set, page, duration, parent=None, image_file=None):
     # Create banner objects for each rateup.
     banners = [Banner(rateup_titles[i], dates[i][0], dates[i][1], date_origins[i], rateups[i]) for i in range(len(rateups))]
 
-    # Check if the event is a subsequent Summoning Campaign that can be merged into a Chapter Release event
-    chapter_release_title = f'{title.split("Summoning Campaign")[0].strip()} Chapter Release'
-    if chapter_release_title in event_set or chapter_release_title + " (US)" in event_set:
-        if chapter_release_title + " (US)" in event_set:
-            chapter_release_title += " (US)"
-        # Get the rateups of the chapter release
-        chapter_release_rateups = [banner.rateups for banner in event_set[chapter_release_title].banners]
-
-        # Check if each rateup list is already in the Chapter Release event
-        for src_i, rateup in enumerate(rateups):
-            # If the rateup is already in the Chapter Release event...
-            if rateup in chapter_release_rateups:
-                # Get the index of the rateup in the Chapter Release event
-                dest_i = chapter_release_rateups.index(rateup)
-
-                # Transfer date duration and rateup title over
-                temp_banner = Banner(rateup_titles[src_i], dates[src_i][0], dates[src_i][1], date_origins[src_i], None)
-                event_set[chapter_release_title].banners[dest_i].copy_metadata(temp_banner)
-            # If the rateup list is not already in the Chapter Release event, add it
-            else:
-                event_set[chapter_release_title].banners.append(banners[src_i])
-    # If the banner already has a predetermined parent, add it to that parent
-    elif parent:
-        # If the parent event already exists, add the banners to it
-        try:
-            event_set[parent].banners.extend(banners)
-        # If the parent event does not exist, create it
-        except KeyError:
-            new_event = Event(parent, CURRENT_REGION, image_file, banners)
-            event_set[new_event] = new_event
-    # If the event is not in the set, add it
-    else:
-        new_event = Event(title, CURRENT_REGION, image_file, banners)
-        event_set[new_event] = new_event
+    # Add the banners to the event
+    add_banners(event_set, title, banners, parent, image_file)
+    record_timing(title, 'rateups', start)
 
 # Delete any pre-release events with rateups that are already in the main event
 def pre_release_remove(event_set):
-    # Get the list of events
-    events = list(event_set.values())
-    keys = list(event_set.keys())
-    try:
-        # Check the last 3 events before the one just added
-        for i in range(-2, -5, -1):
-            mark_for_del = False
-
-            # Get the list of rateups for the event being checked
-            prev_event_rateups = [banner.rateups for banner in events[i].banners]
-            # Check if any of the rateups are in the recently parsed event
-            for rateup in prev_event_rateups:
-                # Get the list of rateups for the recently parsed event
-                recent_event_rateups = [banner.rateups for banner in events[-1].banners]
-                # If the rateup is in the recently parsed event, copy the name and date over and delete it later
-                if rateup in recent_event_rateups:
-                    # Get the source and destination indexes of the rateup
-                    dest_i = recent_event_rateups.index(rateup)
-                    src_i = prev_event_rateups.index(rateup)
-                    # Copy the name and date over
-                    events[-1].banners[dest_i].copy_metadata(events[i].banners[src_i])
-                    # Mark the event for deletion
-                    mark_for_del = True
-            # Delete the checked redundant event
-            if mark_for_del == True:
-                del event_set[keys[i]]
-    # Skip if there are less than 3 events
-    except IndexError:
-        pass
+    # Get the recently parsed event and the 3 events before it
+    recent_event, *prev_events = event_set.last(4) or [None]
+    if not prev_events:
+        return
+
+    # Get the rateups of the recently parsed event
+    recent_event_rateups = recent_event.rateup_index()
+    # Check the last 3 events before the one just added
+    for prev_event in prev_events:
+        mark_for_del = False
+
+        # Check if any of the rateups of the event being checked are in the recently parsed event
+        for rateup, src_i in prev_event.rateup_index().items():
+            # If the rateup is in the recently parsed event, copy the name and date over and delete it later
+            if rateup in recent_event_rateups:
+                # Copy the name and date over
+                recent_event.banners[recent_event_rateups[rateup]].copy_metadata(prev_event.banners[src_i])
+                # Mark the event for deletion
+                mark_for_del = True
+        # Delete the checked redundant event
+        if mark_for_del == True:
+            del event_set[prev_event]
 
 # Delete any subsequent summoning campaigns that are already in the main event
 def post_release_remove(event_set):
-    # Get the list of events
-    events = list(event_set.values())
-    try:
-        mark_for_del = False
-        # Check the last 3 events before the one just added
-        for i in range(-2, -5, -1):
-            # Get the list of rateups for the recently parsed event
-            recent_event_rateups = [banner.rateups for banner in events[-1].banners]
-            # Check if any of the rateups are in the event being checked
-            for rateup in recent_event_rateups:
-                # Get the list of rateups for the event being checked
-                prev_event_rateups = [banner.rateups for banner in events[i].banners]
-                # If the rateup is in the event being checked, copy the name and date over and delete it later
-                if rateup in prev_event_rateups:
-                    # Get the source and destination indexes of the rateup
-                    dest_i = prev_event_rateups.index(rateup)
-                    src_i = recent_event_rateups.index(rateup)
-                    # Copy the name and date over
-                    events[i].banners[dest_i].copy_metadata(events[-1].banners[src_i])
-                    # Mark the event for deletion
-                    mark_for_del = True
-    # Skip if there are less than 3 events
-    except IndexError:
-        pass
+    # Get the recently parsed event and the 3 events before it
+    recent_event, *prev_events = event_set.last(4) or [None]
+    if not prev_events:
+        return
+
+    mark_for_del = False
+    # Get the rateups of the recently parsed event
+    recent_event_rateups = recent_event.rateup_index()
+    # Check the last 3 events before the one just added
+    for prev_event in prev_events:
+        # Get the rateups of the event being checked
+        prev_event_rateups = prev_event.rateup_index()
+        # Check if any of the rateups are in the event being checked
+        for rateup, src_i in recent_event_rateups.items():
+            # If the rateup is in the event being checked, copy the name and date over and delete it later
+            if rateup in prev_event_rateups:
+                # Copy the name and date over
+                prev_event.banners[prev_event_rateups[rateup]].copy_metadata(recent_event.banners[src_i])
+                # Mark the event for deletion
+                mark_for_del = True
     # Delete the recently parsed redundant event
     if mark_for_del == True:
-        del event_set[list(event_set.keys())[-1]]
+        del event_set[recent_event]
 
 # Merge any pre-release events not already in the main event
 def pre_release_merge(event_set):
-    # Delete any existing precampaigns
-    events = list(event_set.values())
-    keys = list(event_set.keys())
-    try:
-        for i in range(-2, -5, -1):
-            # Find the name of the event the pre-release is for
-            pre_release_parent = events[i].name.split("Pre-Release")[0].strip()
-            # If that event is the same as the most recent event, merge the pre-release into the main event
-            if pre_release_parent == events[-1].name or pre_release_parent + " (US)" == events[-1].name:
-                # Merge the pre-release banners into the main event
-                events[-1].banners.extend(events[i].banners)
-                # Delete the pre-release event
-                del event_set[keys[i]]
-    # Skip if there are less than 3 events
-    except IndexError:
-        pass
+    # Get the recently parsed event and the 3 events before it
+    recent_event, *prev_events = event_set.last(4) or [None]
+    for prev_event in prev_events:
+        # Find the name of the event the pre-release is for
+        pre_release_parent = prev_event.name.split("Pre-Release")[0].strip()
+        # If that event is the same as the most recent event, merge the pre-release into the main event
+        if pre_release_parent == recent_event.name or pre_release_parent + " (US)" == recent_event.name:
+            # Merge the pre-release banners into the main event
+            recent_event.banners.extend(prev_event.banners)
+            # Delete the pre-release event
+            del event_set[prev_event]
 
 # Parse event start and end dates from banners
 def create_event_dates(event_set):
@@ -1008,40 +1274,190 @@ def create_event_dates(event_set):
         event_set[event].start_date = min(start_dates)
         event_set[event].end_date = max(end_dates)
 
-# Recursively check for summoning campaign subpages
-def rec_check_subpages(event_set, event_page, date, parent_title):
-    # Get the contents of the event page
-    event_text = event_page.text
-    # Parse the event page
-    event_wikicode = mwparserfromhell.parse(event_text)
-
-    # Get the templates in the event page
-    event_templates = event_wikicode.filter_templates()
-    # For each template in the event page...
-    for event_template in event_templates:
+# Find the summoning campaign subpages included in a page
+def find_subpages(page):
+    # Skip parsing pages that can't include any subpages
+    if not any(keyword in get_page_text(page) for keyword in SUMMON_SUBPAGE):
+        return []
+
+    # Get the templates of the page, sharing the parsed page with parse()
+    _, _, templates = parse_page(page)
+
+    subpages = []
+    # For each template in the page...
+    for template in templates:
         # Get the name of the subpage
-        event_subpage = str(event_template.name)
+        subpage = str(template.name)
         # If the subpage name contains any of the keywords indicating a summoning campaign subpage...
-        if any(keyword in event_subpage for keyword in SUMMON_SUBPAGE):
+        if any(keyword in subpage for keyword in SUMMON_SUBPAGE):
             # Get the name of the summoning campaign page (get rid of the ':')
-            summon_name = event_subpage[1:]
-            # Open the summoning campaign page
-            summon_page = pywikibot.Page(SITE, summon_name)
-            # Parse the summoning campaign page for rateups
-            parse(event_set, summon_page, date, parent=parent_title)
+            subpages.append(subpage[1:])
+    return subpages
+
+# Fetch all summoning campaign subpages below the given pages, one level of subpages at a time
+def crawl_subpages(titles):
+    crawled = set()
+    # Start with the subpages of the given pages
+    level = [subpage for title in titles for subpage in find_subpages(get_page(title))]
+    while level:
+        # Skip subpages that were already fetched, however their titles are written
+        level = list(dict.fromkeys(normalize_title(title) for title in level if normalize_title(title) not in crawled))
+        crawled.update(level)
+        # Fetch the whole level in batched queries
+        load_pages(level)
+        # Find the next level of subpages
+        level = [subpage for title in level for subpage in find_subpages(get_page(title))]
+
+# Recursively check for summoning campaign subpages
+# The subpages are fetched by crawl_subpages() beforehand, so this only reads from the page cache
+def rec_check_subpages(event_set, event_page, date, parent_title):
+    # For each summoning campaign subpage in the event page...
+    for summon_name in find_subpages(event_page):
+        # Open the summoning campaign page
+        summon_page = get_page(summon_name)
+        # Parse the summoning campaign page for rateups
+        parse(event_set, summon_page, date, parent=parent_title)
+
+        # Check another level of subpages
+        rec_check_subpages(event_set, summon_page, date, parent_title)
+        # Remove any pre-release events with rateups that are already in the main event
+        pre_release_remove(event_set)
+
+# Convert an event into a JSON-serializable dictionary
+def dump_event(event):
+    return {
+        'name' : event.name,
+        'region' : event.region,
+        'image_file' : event.image_file,
+        'banners' : [{
+            'name' : banner.name,
+            'start_date' : banner.start_date.isoformat(),
+            'end_date' : banner.end_date.isoformat(),
+            'date_origin' : banner.date_origin,
+            'rateups' : banner.rateups.names(),
+        } for banner in event.banners],
+    }
+
+# Convert a dictionary created by dump_event() back into an event
+def load_event(event_dict):
+    banners = [Banner(banner['name'],
+                      date.fromisoformat(banner['start_date']),
+                      date.fromisoformat(banner['end_date']),
+                      banner['date_origin'],
+                      Rateup(int(servant_id) for servant_id in banner['rateups']))
+               for banner in event_dict['banners']]
+    return Event(event_dict['name'], event_dict['region'], event_dict['image_file'], banners)
+
+# Hash the files the event sets are built from
+def banner_state_fingerprint():
+    sha1 = hashlib.sha1()
+    for file_name in BANNER_STATE_INPUTS:
+        with open(os.path.join(DIR_PATH, file_name), 'rb') as f:
+            sha1.update(f.read())
+    return sha1.hexdigest()
+
+def load_banner_state(incremental):
+    """
+    Record the start time of the build and load the state of the previous build for an incremental build.
+    Returns the previous state with the set of page titles edited since the previous build, or None if a full build
+    is needed.
+
+    Args:
+        incremental: Whether an incremental build was requested
+    """
+    global BUILD_TIMESTAMP
+    BUILD_TIMESTAMP = server_time()
+
+    if not incremental:
+        return None
+
+    # Load the state of the previous build
+    try:
+        with open(os.path.join(DIR_PATH, BANNER_STATE_FILE)) as f:
+            state = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        print("No previous build found, doing a full build...")
+        return None
+
+    # Do a full build if the servants or parser changed since the previous build
+    if state['fingerprint'] != banner_state_fingerprint():
+        print("Servant data or parser changed since the previous build, doing a full build...")
+        return None
+
+    # Do a full build if the previous build is older than the recent changes kept by the wiki
+    since = pywikibot.Timestamp.fromISOformat(state['timestamp'])
+    if BUILD_TIMESTAMP - since > timedelta(days=RECENT_CHANGES_MAX_AGE):
+        print("Previous build is older than the wiki's recent changes, doing a full build...")
+        return None
+
+    # Get the titles of all pages edited since the previous build
+    print(f"Checking for pages changed since {state['timestamp']}...")
+    state['changed'] = recent_changes(since)
+    return state
+
+def save_banner_state():
+    # The recording is not the live wiki, so leave the state of the last live build alone when replaying
+    if replaying():
+        return
+    # Save the snapshots so the next incremental build can skip the event lists that didn't change
+    state = {
+        'timestamp' : BUILD_TIMESTAMP.isoformat(),
+        'fingerprint' : banner_state_fingerprint(),
+        'regions' : BANNER_STATE,
+    }
+    path = os.path.join(DIR_PATH, BANNER_STATE_FILE)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(state, f)
+    os.replace(path + '.tmp', path)
+
+# Restore the event set from the previous build up to the first event list affected by the changed pages.
+# Returns the index of the first event list that needs to be parsed again.
+def restore_event_lists(event_lists, region, event_set, state):
+    snapshots = state['regions'].get(region, {})
+
+    # Find the first event list that is new, is for the present year, or had any of its pages changed
+    for first_changed, event_list in enumerate(event_lists):
+        if event_list not in snapshots \
+            or int(event_list.split('/')[1][:4]) == PRESENT_YEAR \
+            or not state['changed'].isdisjoint([event_list] + snapshots[event_list]['pages']):
+            break
+    else:
+        first_changed = len(event_lists)
 
-            # Check another level of subpages
-            rec_check_subpages(event_set, summon_page, date, parent_title)
-            # Remove any pre-release events with rateups that are already in the main event
-            pre_release_remove(event_set)
+    if first_changed == 0:
+        return 0
+
+    # Restore the event set as it was after the last unchanged event list
+    event_set.clear()
+    for event_dict in snapshots[event_lists[first_changed - 1]]['events']:
+        event = load_event(event_dict)
+        event_set[event] = event
+
+    # Keep the snapshots and visited pages of the unchanged event lists
+    for event_list in event_lists[:first_changed]:
+        BANNER_STATE[region][event_list] = snapshots[event_list]
+        PAGES_VISITED.update(snapshots[event_list]['pages'])
+
+    print(f"Reusing {first_changed} unchanged event lists from the previous build...")
+    return first_changed
 
 # Parse events
-def parse_event_lists(event_lists, region):
+def parse_event_lists(event_lists, region, state=None):
     global CURRENT_YEAR
     global CURRENT_REGION
 
+    # Skip the event lists that didn't change since the previous build
+    if state is not None:
+        event_lists = event_lists[restore_event_lists(event_lists, region, EVENT_SET_NA if region == "NA" else EVENT_SET_JP, state):]
+
+    # Check all the event lists for changes at once
+    load_pages(event_lists)
+
     # Parse event lists
     for event_list in event_lists:
+        # Keep track of the pages read while parsing the event list, even if another event list already read them
+        EVENT_LIST_PAGES.clear()
+
         # Get the current year and region of the event list
         CURRENT_YEAR = int(event_list.split('/')[1][:4])
         CURRENT_REGION = region
@@ -1050,7 +1466,7 @@ def parse_event_lists(event_lists, region):
         event_set = EVENT_SET_NA if CURRENT_REGION == "NA" else EVENT_SET_JP
 
         # Open the event list page
-        page = pywikibot.Page(SITE, event_list)
+        page = get_page(event_list)
         print(f"Parsing {page.title()}...")
 
         # Get the contents of the event list page
@@ -1128,14 +1544,15 @@ def parse_event_lists(event_lists, region):
         images.reverse()
 
         if CURRENT_YEAR == PRESENT_YEAR:
-            current_event_category = pywikibot.Category(SITE, "Current Event" if CURRENT_REGION == "JP" else "Current Event (US)")
             current_events = []
-            for page in current_event_category.articles():
-                title = page.title()
-                # If title in PAGES_VISITED, skip it
-                if title in PAGES_VISITED or title in events:
-                    continue
-                image_file, duration = get_header_info(page)
+            # Skip current events that were already visited or are in the event list
+            current_titles = category_members("Current Event" if CURRENT_REGION == "JP" else "Current Event (US)")
+            current_titles = [title for title in current_titles if title not in PAGES_VISITED and title not in events]
+            # Fetch all the current event pages at once
+            load_pages(current_titles)
+            for title in current_titles:
+                EVENT_LIST_PAGES.add(title)
+                image_file, duration = get_header_info(get_page(title))
                 current_events.append((title, duration, image_file))
                 # Sort current events by starting date in duration
                 current_events.sort(key=lambda x: (x[1][0], x[1][1]))
@@ -1160,12 +1577,20 @@ def parse_event_lists(event_lists, region):
         event_dates = dict(zip(events, date_list))
         event_images = dict(zip(events, images))
 
+        # Prefetch every event page and explicitly defined subpage in batches so the events are parsed from memory
+        prefetch_titles = list(events)
+        for event in events:
+            prefetch_titles.extend(INCLUDE_SUBPAGES.get(event, []))
+        load_pages(prefetch_titles)
+        # Fetch the summoning campaign subpages of every event, one level of subpages at a time
+        crawl_subpages([event for event in events if event not in ADD_EMPTY_ENTRY])
+
         # Parse each event
         for event in (pbar := tqdm(events, bar_format=BAR_FORMAT_BANNERS)):
             pbar.set_postfix_str(event)
 
             # Open the event page
-            event_page = pywikibot.Page(SITE, event)
+            event_page = get_page(event)
             # Parse the event page
             parse(event_set, event_page, event_dates[event], image_file=event_images[event])
 
@@ -1173,7 +1598,7 @@ def parse_event_lists(event_lists, region):
             if event_page.title() in INCLUDE_SUBPAGES:
                 for subpage in INCLUDE_SUBPAGES[event_page.title()]:
                     # Open the subpage
-                    summon_page = pywikibot.Page(SITE, subpage)
+                    summon_page = get_page(subpage)
                     # Parse the subpage and set the parent to the event page
                     parse(event_set, summon_page, event_dates[event], parent=event_page.title())
                     # Remove any pre-release events with rateups that are already in the main event
@@ -1188,6 +1613,15 @@ def parse_event_lists(event_lists, region):
             # Merge any pre-release events not already in the main event
             pre_release_merge(event_set)
 
+        # Take a snapshot of the event set for incremental builds
+        BANNER_STATE[region][event_list] = {
+            'events' : [dump_event(event) for event in event_set.values()],
+            'pages' : sorted(EVENT_LIST_PAGES),
+        }
+
+    # Save the page cache so the next run only downloads pages that changed
+    save_page_cache()
+
 # Remove events with no banners.
 def remove_empty(event_set):
     # Check each event for empty banners.
@@ -1200,89 +1634,71 @@ def remove_empty(event_set):
 def fix_banner_names(event_set):
     # Check each event to apply fixes to banner names
     for event in event_set:
-        # Get the list of banner titles.
-        banner_titles = [banner.name for banner in event_set[event].banners]
-        # If multiple banners have the same name and only one needs to be renamed.
-        skipped_dict = {}
         # Check each banner title
-        for i, banner_title in enumerate(banner_titles):
-            # Apply any explicitly defined fixes
-            for original, replace in BANNER_NAME_FIX.items():
-                # If the original string has "<SKIP#>string_to_replace" in it
-                if "<SKIP" in original:
-                    # Get the string_to_replace which is after the "<SKIP#>" part
-                    skip_key = original[5:].split(">")[1]
-                    skip_num = int(original[5:].split(">")[0])
-
-                    # If the skip_key is not in the skipped_dict, initialize its count
-                    if skip_key not in skipped_dict:
-                        skipped_dict[skip_key] = 1
-                        continue
-                    # Increment the counter if it hasn't reached skip_num
-                    elif skipped_dict[skip_key] < skip_num:
-                        skipped_dict[skip_key] += 1
-                        continue
-                    # If the skip_num has been reached, replace the string
-                    substituted = re.sub(skip_key, replace, banner_title)
-                else:
-                    # Replace it normally if string is present
-                    substituted = re.sub(original, replace, banner_title)
-                
-                if substituted != banner_title:
-                    event_set[event].banners[i].name = substituted
-                    banner_title = substituted
+        for i, banner in enumerate(event_set[event].banners):
+            # Skip banners that none of the fixes apply to
+            if not BANNER_NAME_ANY.search(banner.name):
+                continue
+            # Apply any explicitly defined fixes in order
+            for pattern, replace, skip in BANNER_NAME_RULES:
+                # Skip the first banners of the event if the fix is marked with "<SKIP#>"
+                if i >= skip:
+                    banner.name = pattern.sub(replace, banner.name)
 
     # Check each event for banners with missing numbers.
     for event in event_set:
-        # Get the list of banner titles.
-        banner_titles = [banner.name for banner in event_set[event].banners]
+        banners = event_set[event].banners
 
-        # Check each banner title for "Campaign" without "Summoning Campaign" and missing numbers 
-        for i, banner_title in enumerate(banner_titles):
+        # Check each banner title for "Campaign" without "Summoning Campaign"
+        for banner in banners:
             # If the banner title ends with "Campaign" but not "Summoning Campaign"...
-            if banner_title.endswith("Campaign") and not banner_title.endswith("Summoning Campaign"):
+            if banner.name.endswith("Campaign") and not banner.name.endswith("Summoning Campaign"):
                 # Add "Summoning " behind "Campaign".
-                event_set[event].banners[i].name = re.sub(r'Campaign$', 'Summoning Campaign', banner_title)
+                banner.name = banner.name[:-len("Campaign")] + "Summoning Campaign"
 
         # Get the list of banner titles.
-        banner_titles = [banner.name for banner in event_set[event].banners]
+        banner_titles = [banner.name for banner in banners]
 
-        # Check each banner title for "Campaign" without "Summoning Campaign" and missing numbers 
+        # Find whether any banner after each banner is a second summoning campaign
+        second_summon_after = [False] * len(banner_titles)
+        for i in range(len(banner_titles) - 2, -1, -1):
+            second_summon_after[i] = second_summon_after[i + 1] or "Summoning Campaign 2" in banner_titles[i + 1]
+
+        # Banners before the current one that are missing a number, by the name before "Summoning Campaign"
+        unnumbered = {}
         for i, banner_title in enumerate(banner_titles):
-            # If the banner title ends with "Summoning Campaign 1" but there's no "Summoning Campaign 2" after it...
-            if "Summoning Campaign 1" in banner_title:
-                # Check the ones after it
-                second_summon_found = False
-                for j in range(i+1, len(banner_titles)):
-                    # If a second campaign is found, don't remove the 1
-                    if "Summoning Campaign 2" in banner_titles[j]:
-                        second_summon_found = True
-                        break
-                # Otherwise, remove the 1
-                if not second_summon_found:
-                    event_set[event].banners[i].name = re.sub(r'Summoning Campaign 1', 'Summoning Campaign', banner_title)
+            # If the banner title ends with "Summoning Campaign 1" but there's no "Summoning Campaign 2" after it, remove the 1
+            if "Summoning Campaign 1" in banner_title and not second_summon_after[i]:
+                banners[i].name = banner_title.replace('Summoning Campaign 1', 'Summoning Campaign')
 
             # If there is a second banner...
             if "Summoning Campaign 2" in banner_title:
-                # Check the ones before it
-                for j in range(max(i-1, 0), -1, -1):
-                    # If it is missing a number, add the number to the end of it.
-                    if banner_titles[j].endswith("Summoning Campaign")\
-                        and banner_titles[j].split("Summoning Campaign")[0].strip() == banner_title.split("Summoning Campaign")[0].strip():
-                        # Add a '1' to the end of the banner name
-                        event_set[event].banners[j].name += " 1"
-                        banner_titles[j] = event_set[event].banners[j].name
-                        break
+                prefix = banner_title.split("Summoning Campaign")[0].strip()
+                # Find the closest banner before it with the same name that is missing a number.
+                # The first banner is checked against itself.
+                if i == 0:
+                    j = 0 if banner_title.endswith("Summoning Campaign") else None
+                else:
+                    j = unnumbered[prefix].pop() if unnumbered.get(prefix) else None
+                # Add a '1' to the end of the banner name
+                if j is not None:
+                    banners[j].name += " 1"
+                    banner_titles[j] = banners[j].name
+
+            # Keep track of the banners that are missing a number
+            if banner_titles[i].endswith("Summoning Campaign"):
+                unnumbered.setdefault(banner_titles[i].split("Summoning Campaign")[0].strip(), []).append(i)
 
     # Apply any explicitly defined banner name changes
-    for event, target_banner, change in BANNER_NAME_CHANGE:
-        try:
-            for banner in event_set[event].banners:
-                if banner.name == target_banner:
-                    banner.name = change
-                    break
-        except KeyError:
-            pass
+    for event in event_set:
+        # Rename the banners with each name in order
+        changes = {}
+        for banner in event_set[event].banners:
+            key = (event.name, banner.name)
+            if key in BANNER_NAME_CHANGES:
+                if key not in changes:
+                    changes[key] = iter(BANNER_NAME_CHANGES[key])
+                banner.name = next(changes[key], banner.name)
 
 def sort_banners(event_set):
     # Sort the banners by date.
@@ -1310,13 +1726,18 @@ def fix_dates(event_set, correct_dates):
                         event_set[target_event].banners[i].start_date = start_date
                     if end_date:
                         event_set[target_event].banners[i].end_date = end_date
-                    event_set[target_event].banners = sorted(event_set[target_event].banners, key=lambda banner: banner.start_date)
+                    # Move the banner to where a stable sort by start date would put it, since the other banners are still sorted
+                    banners = event_set[target_event].banners
+                    del banners[i]
+                    lower = bisect_left(banners, banner.start_date, key=lambda banner: banner.start_date)
+                    upper = bisect_right(banners, banner.start_date, key=lambda banner: banner.start_date)
+                    banners.insert(min(max(i, lower), upper), banner)
                     break
         except KeyError:
             pass
 
 def remove_us_suffix(event_set):
-    temp_dict = {}
+    temp_dict = EventStore()
 
     # Remove the "US" suffix from the end of event names.
     for event in event_set:
@@ -1343,7 +1764,7 @@ def create_debug_json(event_set, region):
                 'start_date': banner.start_date.strftime("%-m/%-d/%Y"),
                 'end_date': banner.end_date.strftime("%-m/%-d/%Y"),
                 'date_origin': banner.date_origin,
-                'rateups': banner.rateups,
+                'rateups': banner.rateups.names(),
                 'num_rateups': len(banner.rateups),
             })
         debug_list.append({
@@ -1409,7 +1830,7 @@ def create_banner_json(event_set_jp, event_set_na):
                     'start_date' : banner.start_date,
                     'end_date' : banner.end_date,
                     'region' : event.region,
-                    'rateups' : banner.rateups,
+                    'rateups' : banner.rateups.names(),
                     'event_id' : event.slug,
                 })
 
@@ -1447,9 +1868,9 @@ def create_servant_json(event_set_jp, event_set_na):
     print("Saving to JSON file...")
     write_json(servant_list, "servant_data.json")
 
-def parse_and_create(event_list, region):
+def parse_and_create(event_list, region, state=None):
     print("Parsing all events...")
-    parse_event_lists(event_list, region)
+    parse_event_lists(event_list, region, state)
 
     event_set = None
     if region == "NA":
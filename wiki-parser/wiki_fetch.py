@@ -0,0 +1,342 @@
+import pywikibot
+import hashlib
+import json
+import os
+import requests
+import shutil
+
+# Number of titles sent in a single batched API query (the API limit for non-bot accounts).
+BATCH_SIZE = 50
+
+# File holding the wikitext of every page read, keyed by title and revision ID.
+PAGE_CACHE_FILE = 'page_cache.json'
+
+# Directory holding the last good copy of every HTTP response along with its validators and checksum.
+HTTP_CACHE_DIR = 'http_cache'
+
+# Files inside a record/replay directory
+RECORDED_PAGES_FILE = 'pages.json'
+RECORDING_FILE = 'recording.json'
+RECORDED_HTTP_DIR = 'http'
+
+DIR_PATH = None # Path to the directory of this file
+SITE = None # Wiki site
+PAGE_CACHE = {} # Cached pages: title -> {'title', 'revid', 'text'}
+PAGES_CHECKED = set() # Titles whose cached revision has been confirmed to be the latest during this run
+RECORD_DIR = None # Directory to record all wiki and HTTP responses into
+REPLAY_DIR = None # Directory to replay all wiki and HTTP responses from
+RECORDING = {'server_time' : None, 'categories' : {}, 'http' : {}} # Recorded responses other than page texts
+
+class WikiPage:
+    """
+    Read-only stand-in for pywikibot.Page whose wikitext comes from the page cache.
+    """
+    def __init__(self, title, revid, text):
+        self._title = title
+        self.revid = revid
+        self.text = text
+
+    def title(self):
+        return self._title
+
+    def __str__(self):
+        return self._title
+
+def fetch_init(record_dir=None, replay_dir=None):
+    """
+    Initialize the page cache, optionally recording every response or replaying recorded responses.
+
+    Args:
+        record_dir: Directory to record all wiki and HTTP responses into
+        replay_dir: Directory to replay all wiki and HTTP responses from, without contacting the wiki
+    """
+    global DIR_PATH
+    global SITE
+    global PAGE_CACHE
+    global PAGES_CHECKED
+    global RECORD_DIR
+    global REPLAY_DIR
+    global RECORDING
+
+    # Only initialize once, since both the servant and banner parsers use the page cache.
+    if DIR_PATH is not None:
+        return
+
+    DIR_PATH = os.path.dirname(__file__) # Path to the directory of this file
+    RECORD_DIR = record_dir
+    REPLAY_DIR = replay_dir
+
+    # Serve everything from the recording instead of the wiki
+    if REPLAY_DIR:
+        with open(os.path.join(REPLAY_DIR, RECORDED_PAGES_FILE), encoding='utf-8') as f:
+            PAGE_CACHE = json.load(f)
+        with open(os.path.join(REPLAY_DIR, RECORDING_FILE), encoding='utf-8') as f:
+            RECORDING = json.load(f)
+        PAGES_CHECKED = set(PAGE_CACHE)
+        return
+
+    SITE = pywikibot.Site() # Wiki site
+
+    if RECORD_DIR:
+        os.makedirs(os.path.join(RECORD_DIR, RECORDED_HTTP_DIR), exist_ok=True)
+
+    # Load the page cache from the previous run.
+    try:
+        with open(os.path.join(DIR_PATH, PAGE_CACHE_FILE), encoding='utf-8') as f:
+            PAGE_CACHE = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        PAGE_CACHE = {}
+
+# Write JSON to a temporary file first so an interrupted run can't corrupt the file.
+def write_json_atomic(obj, path):
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(obj, f)
+    os.replace(path + '.tmp', path)
+
+def save_page_cache():
+    # The recording is not a cache of the live wiki, so leave the page cache alone when replaying.
+    if REPLAY_DIR:
+        return
+    write_json_atomic(PAGE_CACHE, os.path.join(DIR_PATH, PAGE_CACHE_FILE))
+
+# Whether responses are replayed from a recording instead of the wiki, so no live state should be changed.
+def replaying():
+    return bool(REPLAY_DIR)
+
+def save_recording():
+    if not RECORD_DIR:
+        return
+    # Record every page read during this run
+    write_json_atomic({title : PAGE_CACHE[title] for title in PAGES_CHECKED if title in PAGE_CACHE},
+                      os.path.join(RECORD_DIR, RECORDED_PAGES_FILE))
+    write_json_atomic(RECORDING, os.path.join(RECORD_DIR, RECORDING_FILE))
+
+# Normalize a title the same way the wiki does, so differently written titles share a cache entry.
+def normalize_title(title):
+    # Underscores are spaces and repeated whitespace is collapsed
+    title = ' '.join(title.replace('_', ' ').split())
+    # The first letter is always capitalized
+    return title[:1].upper() + title[1:]
+
+# Split a list into chunks of at most BATCH_SIZE items.
+def batched(items, size=BATCH_SIZE):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+def query_pages(titles, content):
+    """
+    Query the latest revision ID, and optionally the wikitext, of up to BATCH_SIZE pages in one request.
+    Returns a dictionary mapping each requested title to a (title, revid, text) tuple.
+    Missing pages, and titles without revisions such as special pages and interwiki links, are returned with a revision
+    ID of 0 and empty text.
+
+    Args:
+        titles: The normalized titles of the pages
+        content: Whether to also fetch the wikitext of the pages
+    """
+    parameters = {
+        'action': 'query',
+        'prop': 'revisions',
+        'titles': titles,
+        'rvprop': 'ids|content' if content else 'ids',
+        'rvslots': 'main',
+    }
+    results = {}
+    while True:
+        data = SITE.simple_request(**parameters).submit()
+        query = data.get('query', {})
+
+        # Map the titles returned by the wiki back to the titles that were requested
+        requested = {normalized['to']: normalized['from'] for normalized in query.get('normalized', [])}
+
+        pages = query.get('pages', {})
+        for page in (pages.values() if isinstance(pages, dict) else pages):
+            title = page['title']
+            key = requested.get(title, title)
+            # Missing pages read as empty text, the same as pywikibot.Page.text
+            if 'missing' in page or 'invalid' in page:
+                results[key] = (title, 0, '')
+            # Pages without revisions have had their content pushed to the continuation of the query
+            elif 'revisions' in page:
+                revision = page['revisions'][0]
+                text = None
+                if content:
+                    slot = revision['slots']['main']
+                    text = slot.get('content', slot.get('*', ''))
+                results[key] = (title, revision['revid'], text)
+
+        # Keep querying until every page has been returned
+        if 'continue' not in data:
+            break
+        parameters.update(data['continue'])
+
+    # Titles that never got a revision, such as special pages ("special") and interwiki links (listed under "interwiki"
+    # instead of "pages"), read as empty text the same as missing pages
+    for title in titles:
+        if title not in results:
+            results[title] = (title, 0, '')
+
+    return results
+
+def load_pages(titles):
+    """
+    Bring the cached wikitext of the given pages up to date.
+    The latest revision IDs of already cached pages are checked in batches and only the pages that changed since they
+    were cached are downloaded again.
+
+    Args:
+        titles: The titles of the pages to load
+    """
+    # Every recorded page is already loaded when replaying
+    if REPLAY_DIR:
+        return
+
+    # Skip pages that have already been checked during this run
+    titles = list(dict.fromkeys(normalize_title(title) for title in titles))
+    titles = [title for title in titles if title not in PAGES_CHECKED]
+
+    # Pages that were never cached need to be downloaded without checking their revision
+    outdated = [title for title in titles if title not in PAGE_CACHE]
+    cached = [title for title in titles if title in PAGE_CACHE]
+
+    # Check the latest revision of every cached page
+    for batch in batched(cached):
+        revisions = query_pages(batch, content=False)
+        for title in batch:
+            if title in revisions and revisions[title][1] == PAGE_CACHE[title]['revid']:
+                PAGES_CHECKED.add(title)
+            else:
+                outdated.append(title)
+
+    # Download the pages that changed
+    for batch in batched(outdated):
+        for title, (page_title, revid, text) in query_pages(batch, content=True).items():
+            PAGE_CACHE[title] = {'title': page_title, 'revid': revid, 'text': text}
+            PAGES_CHECKED.add(title)
+
+def get_page(title):
+    """
+    Get a page with its latest wikitext, downloading it only if it changed since it was cached.
+
+    Args:
+        title: The title of the page
+    """
+    title = normalize_title(title)
+    if title not in PAGES_CHECKED:
+        load_pages([title])
+    if title not in PAGE_CACHE:
+        raise KeyError(f"Page {title} was not recorded" if REPLAY_DIR else f"Page {title} could not be loaded")
+    page = PAGE_CACHE[title]
+    return WikiPage(page['title'], page['revid'], page['text'])
+
+def category_members(category):
+    """
+    Get the titles of the articles in a category.
+
+    Args:
+        category: The name of the category
+    """
+    if not REPLAY_DIR:
+        RECORDING['categories'][category] = [page.title() for page in pywikibot.Category(SITE, category).articles()]
+    return RECORDING['categories'][category]
+
+def server_time():
+    """
+    Get the current time of the wiki's server.
+    """
+    if not REPLAY_DIR:
+        RECORDING['server_time'] = SITE.server_time().isoformat()
+    return pywikibot.Timestamp.fromISOformat(RECORDING['server_time'])
+
+def recent_changes(since):
+    """
+    Get the titles of all pages changed since the given time.
+
+    Args:
+        since: The time to list changes from
+    """
+    # Nothing changes in a recording
+    if REPLAY_DIR:
+        return set()
+    return {change['title'] for change in SITE.recentchanges(start=since, reverse=True) if 'title' in change}
+
+# Get the SHA-1 of a file, or None if it doesn't exist.
+def file_sha1(path):
+    sha1 = hashlib.sha1()
+    try:
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                sha1.update(chunk)
+    except FileNotFoundError:
+        return None
+    return sha1.hexdigest()
+
+def fetch_file(url, timeout=None):
+    """
+    Download an HTTP response into the HTTP cache and return the path of the local copy.
+    The cached copy is revalidated with ETag / If-Modified-Since and reused if it didn't change. If the request fails,
+    the last good copy is used as long as its checksum still matches.
+    The copy holds the raw bytes of the response, so text responses need to be opened with their encoding.
+
+    Args:
+        url: The URL to get
+        timeout: Timeout of the request in seconds
+    """
+    file_name = hashlib.sha1(url.encode()).hexdigest()
+
+    # Read the recorded response
+    if REPLAY_DIR:
+        if url not in RECORDING['http']:
+            raise KeyError(f"Response from {url} was not recorded")
+        return os.path.join(REPLAY_DIR, RECORDED_HTTP_DIR, RECORDING['http'][url])
+
+    cache_dir = os.path.join(DIR_PATH, HTTP_CACHE_DIR)
+    os.makedirs(cache_dir, exist_ok=True)
+    path = os.path.join(cache_dir, file_name)
+
+    # Load the validators of the cached copy, but only trust them if the copy is intact
+    try:
+        with open(path + '.json', encoding='utf-8') as f:
+            meta = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        meta = {}
+    cached = bool(meta) and file_sha1(path) == meta['sha1']
+
+    headers = {}
+    if cached and meta.get('etag'):
+        headers['If-None-Match'] = meta['etag']
+    if cached and meta.get('last_modified'):
+        headers['If-Modified-Since'] = meta['last_modified']
+
+    try:
+        with requests.get(url, headers=headers, timeout=timeout, stream=True) as response:
+            # Reuse the cached copy if it didn't change
+            if response.status_code == 304 and cached:
+                print(f'{url} not modified, using cached copy')
+            else:
+                response.raise_for_status()
+                # Stream the response into a temporary file so a failed download keeps the last good copy
+                sha1 = hashlib.sha1()
+                with open(path + '.tmp', 'wb') as f:
+                    for chunk in response.iter_content(chunk_size=1024 * 1024):
+                        sha1.update(chunk)
+                        f.write(chunk)
+                os.replace(path + '.tmp', path)
+                write_json_atomic({
+                    'url' : url,
+                    'etag' : response.headers.get('ETag'),
+                    'last_modified' : response.headers.get('Last-Modified'),
+                    'sha1' : sha1.hexdigest(),
+                }, path + '.json')
+    except requests.RequestException as e:
+        # Fall back to the last good copy
+        if not cached:
+            raise
+        print(f'Failed to fetch {url} ({e}), using cached copy')
+
+    # Record the response
+    if RECORD_DIR:
+        shutil.copyfile(path, os.path.join(RECORD_DIR, RECORDED_HTTP_DIR, file_name))
+        RECORDING['http'][url] = file_name
+
+    return path
@@ -1,14 +1,57 @@
 import os
+import time
+import hashlib
+import json
 import pywikibot
 import jsons
 import requests
 from tqdm import tqdm
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
+from PIL import Image
+from wiki_fetch import batched, file_sha1
 
 # Define format of progress bar.
 BAR_FORMAT_IMAGES = "{l_bar}{bar:50}{r_bar}{bar:-50b}"
 
+# Number of images downloaded at the same time
+DOWNLOAD_WORKERS = 8
+
+# Number of attempts per image, and the delay in seconds before the first retry (doubled on every retry)
+DOWNLOAD_ATTEMPTS = 5
+DOWNLOAD_BACKOFF = 1
+
+# HTTP status codes worth retrying
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# Manifest recording the size, SHA-1 and source URL of every downloaded image
+# Written as {"complete" : true, "images" : {path under imgs/ : entry}} once every image has been checked.
+IMAGE_MANIFEST_FILE = "imgs/manifest.json"
+
+# Widths in pixels of the resized copies made of every image (images are never scaled up)
+VARIANT_WIDTHS = (64, 128, 256)
+VARIANT_FORMAT = "webp"
+VARIANT_QUALITY = 80
+
+# Folder holding the resized copies and the manifest mapping each image to its resized copies
+VARIANT_DIR = "imgs/variants"
+VARIANT_MANIFEST_FILE = "imgs/variants.json"
+
+# Servant faces are packed into sprite sheets of SPRITE_COLUMNS x SPRITE_ROWS icons of SPRITE_SIZE pixels each
+SPRITE_SIZE = 128
+SPRITE_COLUMNS = 10
+SPRITE_ROWS = 10
+
+# Folder holding the sprite sheets and the map of each servant's icon on them
+SPRITE_DIR = "imgs/sprites"
+SPRITE_MAP_FILE = "imgs/sprites/servants.json"
+
 DIR_PATH = None
 SITE = None
+SESSION = None
+EVENT_IMAGE_INFO = {} # URL, size and SHA-1 of each event image on the wiki
+IMAGE_MANIFEST = {} # Manifest entry of each downloaded image, keyed by its path under imgs/
+MANIFEST_COMPLETE = False # Whether the manifest was written by a run that checked every image
 EVENT_DATA = None
 SERVANT_DATA = None
 IMAGES = None
@@ -21,10 +64,17 @@ def image_init():
     global SERVANT_DATA
     global IMAGES
     global SERVANT_IMAGES
+    global SESSION
 
     DIR_PATH = os.path.dirname(__file__) # Path to the directory of this file
     SITE = pywikibot.Site() # Wiki site
 
+    # Share one pool of keep-alive connections between all the download workers
+    SESSION = requests.Session()
+    adapter = HTTPAdapter(pool_connections=DOWNLOAD_WORKERS, pool_maxsize=DOWNLOAD_WORKERS)
+    SESSION.mount('http://', adapter)
+    SESSION.mount('https://', adapter)
+
     # Import the event data.
     with open(os.path.join(DIR_PATH, 'event_data.json')) as f:
         EVENT_DATA = jsons.loads(f.read())
@@ -39,50 +89,369 @@ def image_init():
     # Get the image files of all the servants.
     SERVANT_IMAGES = [servant['image_file'] for servant in SERVANT_DATA]
 
-def download_event_images():
-    # Create imgs root folder if it doesn't exist
-    if not os.path.exists("imgs"):
-        os.makedirs("imgs")
-    
-    # If folder "imgs/imgs_events" exists...
-    if os.path.exists("imgs/imgs_events"):
-        # Get a list of all the files in the folder.
-        files = set(os.listdir("imgs/imgs_events"))
-        # Make a list of all the images that are in IMAGES but not in files.
-        images_to_download = [image for image in IMAGES if image not in files]
+def download_file(url, path, size=None, sha1=None):
+    """
+    Download a file, retrying with exponential backoff on connection errors, server errors and corrupt transfers.
+    The file is written to a temporary file and renamed once complete, so an interrupted download never leaves a
+    truncated file behind.
+
+    Args:
+        url: The URL of the file
+        path: The path to save the file to
+        size: The expected size of the file in bytes, if known
+        sha1: The expected SHA-1 of the file, if known
+    Returns the SHA-1 of the downloaded file.
+    """
+    for attempt in range(DOWNLOAD_ATTEMPTS):
+        try:
+            digest = hashlib.sha1()
+            with SESSION.get(url, stream=True, timeout=30) as response:
+                response.raise_for_status()
+                with open(path + '.part', 'wb') as f:
+                    for chunk in response.iter_content(chunk_size=64 * 1024):
+                        digest.update(chunk)
+                        f.write(chunk)
+            # Verify the transfer against the size and SHA-1 reported by the wiki
+            if (size is not None and os.path.getsize(path + '.part') != size) \
+                or (sha1 is not None and digest.hexdigest() != sha1):
+                raise requests.RequestException(f"Size or SHA-1 of {url} does not match")
+            os.replace(path + '.part', path)
+            return digest.hexdigest()
+        except requests.RequestException as e:
+            # Give up on the last attempt and on errors that won't go away, such as missing files
+            retryable = not isinstance(e, requests.HTTPError) or e.response.status_code in RETRY_STATUSES
+            if not retryable or attempt == DOWNLOAD_ATTEMPTS - 1:
+                raise
+            time.sleep(DOWNLOAD_BACKOFF * 2 ** attempt)
+
+def download_images(folder, sources, desc):
+    """
+    Download images concurrently on a pool of workers and record them in the manifest.
+
+    Args:
+        folder: The folder under imgs/ to download the images into
+        sources: Dictionary mapping each image file to its URL, size and SHA-1
+        desc: Description shown on the progress bar
+    """
+    with ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS) as executor:
+        futures = {}
+        for image_file, source in sources.items():
+            if source['url'] is None:
+                print(f"Failed to download {image_file}: File not found")
+                continue
+            futures[executor.submit(download_file, source['url'], f'imgs/{folder}/{image_file}', source['size'], source['sha1'])] = image_file
+
+        for future in (pbar := tqdm(as_completed(futures), total=len(futures), bar_format=BAR_FORMAT_IMAGES, desc=desc)):
+            image_file = futures[future]
+            pbar.set_postfix_str(image_file)
+            try:
+                sha1 = future.result()
+            except (requests.RequestException, OSError) as e:
+                pbar.clear()
+                print(f"Failed to download {image_file}: {e}")
+                continue
+            # Record the downloaded image
+            stat = os.stat(f'imgs/{folder}/{image_file}')
+            IMAGE_MANIFEST[f'{folder}/{image_file}'] = {
+                'size' : stat.st_size,
+                'mtime' : stat.st_mtime_ns,
+                'sha1' : sha1,
+                'url' : sources[image_file]['url'],
+            }
+
+def load_manifest():
+    global IMAGE_MANIFEST
+    global MANIFEST_COMPLETE
+    try:
+        with open(IMAGE_MANIFEST_FILE, encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        manifest = {}
+    # Manifests that are missing, unreadable or in the old format without the marker aren't trusted to delete files
+    if isinstance(manifest.get('images'), dict) and manifest.get('complete') is True:
+        IMAGE_MANIFEST = manifest['images']
+        MANIFEST_COMPLETE = True
     else:
-        os.makedirs("imgs/imgs_events")
-        images_to_download = IMAGES
+        IMAGE_MANIFEST = {key : entry for key, entry in manifest.items() if isinstance(entry, dict) and 'sha1' in entry}
+        MANIFEST_COMPLETE = False
+
+# Save the manifest once every image of a folder has been checked and downloaded
+def save_manifest():
+    with open(IMAGE_MANIFEST_FILE + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump({'complete' : True, 'images' : IMAGE_MANIFEST}, f, indent=2, sort_keys=True)
+    os.replace(IMAGE_MANIFEST_FILE + '.tmp', IMAGE_MANIFEST_FILE)
+
+def verify_images(folder, sources):
+    """
+    Compare a folder of images against the manifest and the expected images in a single scan.
+    Orphaned files this script downloaded are deleted and the images that are missing, corrupt or outdated are returned.
+    Files are only deleted if the manifest was written by a completed run, and files it doesn't list are never deleted.
+    Files are only hashed again when their size or modification time changed since they were recorded.
+
+    Args:
+        folder: The folder under imgs/ holding the images
+        sources: Dictionary mapping each expected image file to its URL, size and SHA-1 (None if unknown)
+    """
+    os.makedirs(f'imgs/{folder}', exist_ok=True)
+    files = {entry.name : entry.stat() for entry in os.scandir(f'imgs/{folder}') if entry.is_file()}
+
+    # Delete downloaded files that are no longer used, including leftovers of interrupted downloads
+    for image_file in files:
+        if image_file in sources:
+            continue
+        if not MANIFEST_COMPLETE:
+            print(f"Keeping unused image imgs/{folder}/{image_file}, since the manifest is not from a completed run")
+        elif f'{folder}/{image_file}' in IMAGE_MANIFEST or image_file.endswith('.part'):
+            print(f"Deleting unused image imgs/{folder}/{image_file}")
+            os.remove(f'imgs/{folder}/{image_file}')
+        else:
+            print(f"Keeping unused image imgs/{folder}/{image_file}, since it was not downloaded by this script")
+    # Keep the entries of unused images that weren't deleted, so they can be deleted once the manifest is complete
+    for key in [key for key in IMAGE_MANIFEST if key.startswith(f'{folder}/') and key.split('/', 1)[1] not in sources]:
+        if MANIFEST_COMPLETE or key.split('/', 1)[1] not in files:
+            del IMAGE_MANIFEST[key]
+
+    images_to_download = []
+    for image_file, source in sources.items():
+        key = f'{folder}/{image_file}'
+        # Download missing images
+        if image_file not in files:
+            IMAGE_MANIFEST.pop(key, None)
+            images_to_download.append(image_file)
+            continue
+
+        stat = files[image_file]
+        entry = IMAGE_MANIFEST.get(key)
+        # Hash images that were changed since they were recorded, or that were never recorded
+        if entry is None or entry['size'] != stat.st_size or entry['mtime'] != stat.st_mtime_ns:
+            sha1 = file_sha1(f'imgs/{folder}/{image_file}')
+            # Download images that were deleted since the folder was scanned
+            if sha1 is None:
+                IMAGE_MANIFEST.pop(key, None)
+                images_to_download.append(image_file)
+                continue
+            # Download images that were corrupted after they were recorded
+            if entry is not None and entry['sha1'] != sha1:
+                images_to_download.append(image_file)
+                continue
+            entry = {'size' : stat.st_size, 'mtime' : stat.st_mtime_ns, 'sha1' : sha1, 'url' : source['url']}
+            IMAGE_MANIFEST[key] = entry
+
+        # Download images that were replaced at the source or don't match the source
+        if (source['url'] is not None and entry['url'] != source['url']) \
+            or (source['size'] is not None and entry['size'] != source['size']) \
+            or (source['sha1'] is not None and entry['sha1'] != source['sha1']):
+            images_to_download.append(image_file)
+
+    return images_to_download
+
+def resolve_event_images(image_files):
+    """
+    Look up the URL, size and SHA-1 of event images on the wiki, with up to 50 images per imageinfo query.
+    The results are saved in EVENT_IMAGE_INFO.
+
+    Args:
+        image_files: The image files to look up
+    """
+    for batch in batched(list(dict.fromkeys(image_files))):
+        parameters = {
+            'action': 'query',
+            'prop': 'imageinfo',
+            'iiprop': 'url|size|sha1',
+            'titles': [f'File:{image_file}' for image_file in batch],
+        }
+        while True:
+            data = SITE.simple_request(**parameters).submit()
+            query = data.get('query', {})
+
+            # Map the titles returned by the wiki back to the image files that were requested
+            requested = {normalized['to']: normalized['from'] for normalized in query.get('normalized', [])}
 
-    for image_file in (pbar := tqdm(images_to_download, bar_format=BAR_FORMAT_IMAGES, desc="Downloading event images")):
-        pbar.set_postfix_str(image_file)
-        page = pywikibot.FilePage(SITE, image_file)
-        page.download(filename=f'imgs/imgs_events/{image_file}.!')
+            pages = query.get('pages', {})
+            for page in (pages.values() if isinstance(pages, dict) else pages):
+                if 'imageinfo' in page:
+                    image_file = requested.get(page['title'], page['title']).split(':', 1)[1]
+                    info = page['imageinfo'][0]
+                    EVENT_IMAGE_INFO[image_file] = {'url' : info['url'], 'size' : info['size'], 'sha1' : info['sha1']}
+
+            if 'continue' not in data:
+                break
+            parameters.update(data['continue'])
+
+def download_event_images():
+    load_manifest()
+
+    # Look up where to download the images from, along with their sizes and hashes to verify them against
+    resolve_event_images(IMAGES)
+    sources = {image_file : EVENT_IMAGE_INFO.get(image_file, {'url' : None, 'size' : None, 'sha1' : None}) for image_file in IMAGES}
+
+    # Find the images that are missing, corrupt or outdated, and delete the ones that are no longer used
+    images_to_download = verify_images("imgs_events", sources)
+    download_images("imgs_events", {image_file : sources[image_file] for image_file in images_to_download}, "Downloading event images")
+    save_manifest()
 
 def download_servant_images():
-    # Create imgs root folder if it doesn't exist
-    if not os.path.exists("imgs"):
-        os.makedirs("imgs")
-    
-    # If folder "imgs/imgs_servants" exists...
-    if os.path.exists("imgs/imgs_servants"):
-        # Get a list of all the files in the folder.
-        files = set(os.listdir("imgs/imgs_servants"))
-        # Make a list of all the images that are in SERVANT_IMAGES but not in files.
-        images_to_download = [image for image in SERVANT_IMAGES if image not in files]
-    else:
-        os.makedirs("imgs/imgs_servants")
-        images_to_download = SERVANT_IMAGES
+    load_manifest()
 
-    for image_file in (pbar := tqdm(images_to_download, bar_format=BAR_FORMAT_IMAGES, desc="Downloading servant images")):
-        pbar.set_postfix_str(image_file)
-        url = f"https://static.atlasacademy.io/JP/Faces/{image_file}"
-        
-        try:
-            response = requests.get(url)
-            response.raise_for_status()
-            
-            with open(f'imgs/imgs_servants/{image_file}', 'wb') as f:
-                f.write(response.content)
-        except requests.RequestException as e:
-            print(f"Failed to download {image_file}: {e}")
+    # Servant faces are named after their files on Atlas Academy, which doesn't provide hashes
+    sources = {image_file : {'url' : f"https://static.atlasacademy.io/JP/Faces/{image_file}", 'size' : None, 'sha1' : None}
+               for image_file in SERVANT_IMAGES if image_file}
+
+    # Find the images that are missing, corrupt or outdated, and delete the ones that are no longer used
+    images_to_download = verify_images("imgs_servants", sources)
+    download_images("imgs_servants", {image_file : sources[image_file] for image_file in images_to_download}, "Downloading servant images")
+    save_manifest()
+
+def make_variants(key):
+    """
+    Create the resized copies of an image. Runs in a worker process.
+    Returns a dictionary mapping each width to the path of its copy, relative to imgs/.
+
+    Args:
+        key: The path of the image under imgs/
+    """
+    folder, image_file = key.split('/', 1)
+    stem = os.path.splitext(image_file)[0]
+    os.makedirs(f'{VARIANT_DIR}/{folder}', exist_ok=True)
+
+    variants = {}
+    with Image.open(f'imgs/{key}') as image:
+        image = image.convert('RGBA')
+        # Use the original width if the image is smaller than every variant
+        widths = [width for width in VARIANT_WIDTHS if width < image.width] or [image.width]
+        for width in widths:
+            height = max(1, round(image.height * width / image.width))
+            path = f'{VARIANT_DIR}/{folder}/{stem}-{width}.{VARIANT_FORMAT}'
+            # Write to a temporary file first so an interrupted run can't leave a truncated copy
+            image.resize((width, height), Image.LANCZOS).save(path + '.part', VARIANT_FORMAT, quality=VARIANT_QUALITY, method=6)
+            os.replace(path + '.part', path)
+            variants[str(width)] = os.path.relpath(path, 'imgs')
+    return variants
+
+def create_image_variants(jobs=None):
+    """
+    Create resized copies of every new or changed image in the manifest, spread across worker processes.
+
+    Args:
+        jobs: The number of worker processes (all cores if None, no workers if 1)
+    """
+    load_manifest()
+    try:
+        with open(VARIANT_MANIFEST_FILE) as f:
+            variant_manifest = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        variant_manifest = {}
+
+    # Delete the copies of images that no longer exist, unless the manifest can't be trusted to list every image
+    for key in [key for key in variant_manifest if key not in IMAGE_MANIFEST and MANIFEST_COMPLETE]:
+        for path in variant_manifest.pop(key)['variants'].values():
+            if os.path.exists(f'imgs/{path}'):
+                print(f"Deleting unused image variant imgs/{path}")
+                os.remove(f'imgs/{path}')
+
+    # Only process images that are new, changed, or missing copies
+    keys = [key for key, entry in IMAGE_MANIFEST.items()
+            if key not in variant_manifest
+            or variant_manifest[key]['sha1'] != entry['sha1']
+            or not all(os.path.exists(f'imgs/{path}') for path in variant_manifest[key]['variants'].values())]
+
+    # Create the copies on a pool of workers, or one at a time in this process if there is a single job
+    executor = ProcessPoolExecutor(max_workers=jobs) if jobs != 1 else None
+    try:
+        if executor:
+            futures = {executor.submit(make_variants, key): key for key in keys}
+            results = ((futures[future], future.result) for future in as_completed(futures))
+        else:
+            results = ((key, lambda key=key: make_variants(key)) for key in keys)
+        for key, result in (pbar := tqdm(results, total=len(keys), bar_format=BAR_FORMAT_IMAGES, desc="Creating image variants")):
+            pbar.set_postfix_str(key)
+            try:
+                variant_manifest[key] = {'sha1' : IMAGE_MANIFEST[key]['sha1'], 'variants' : result()}
+            except OSError as e:
+                pbar.clear()
+                print(f"Failed to create variants of {key}: {e}")
+    finally:
+        if executor:
+            executor.shutdown()
+
+    with open(VARIANT_MANIFEST_FILE + '.tmp', 'w') as f:
+        json.dump(variant_manifest, f, indent=2, sort_keys=True)
+    os.replace(VARIANT_MANIFEST_FILE + '.tmp', VARIANT_MANIFEST_FILE)
+
+def make_sprite_sheet(path, servants):
+    """
+    Pack servant faces into a sprite sheet. Servants without a face leave their slot empty.
+
+    Args:
+        path: The path to save the sprite sheet to
+        servants: The servants on the sheet, in slot order
+    """
+    sheet = Image.new('RGBA', (SPRITE_COLUMNS * SPRITE_SIZE, SPRITE_ROWS * SPRITE_SIZE))
+    for slot, servant in enumerate(servants):
+        image_path = f"imgs/imgs_servants/{servant['image_file']}"
+        if not servant['image_file'] or not os.path.exists(image_path):
+            continue
+        with Image.open(image_path) as image:
+            image = image.convert('RGBA')
+            if image.size != (SPRITE_SIZE, SPRITE_SIZE):
+                image = image.resize((SPRITE_SIZE, SPRITE_SIZE), Image.LANCZOS)
+            sheet.paste(image, ((slot % SPRITE_COLUMNS) * SPRITE_SIZE, (slot // SPRITE_COLUMNS) * SPRITE_SIZE))
+    # Write to a temporary file first so an interrupted run can't leave a truncated sheet
+    sheet.save(path + '.part', 'png', optimize=True)
+    os.replace(path + '.part', path)
+
+def create_servant_sprites():
+    """
+    Pack the face of every servant in servant_data.json into sprite sheets and map each servant's icon by id_num.
+    Servants fill the sheets in ID order, so adding a servant only changes the last sheet. Only sheets whose
+    servants or faces changed since the last run are drawn again.
+    """
+    with open(os.path.join(os.path.dirname(__file__), 'servant_data.json')) as f:
+        servants = sorted(json.load(f), key=lambda servant: servant['id_num'])
+
+    try:
+        with open(SPRITE_MAP_FILE) as f:
+            sprite_map = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        sprite_map = {'sheets' : [], 'sprites' : {}}
+    os.makedirs(SPRITE_DIR, exist_ok=True)
+
+    per_sheet = SPRITE_COLUMNS * SPRITE_ROWS
+    sheets = []
+    sprites = {}
+    for index in (pbar := tqdm(range(0, len(servants), per_sheet), bar_format=BAR_FORMAT_IMAGES, desc="Creating sprite sheets")):
+        sheet_servants = servants[index:index + per_sheet]
+        sheet_file = f'servants-{index // per_sheet}.png'
+        path = f'{SPRITE_DIR}/{sheet_file}'
+
+        # Fingerprint the servants and faces on the sheet to tell if it needs to be drawn again
+        fingerprint = hashlib.sha1()
+        for servant in sheet_servants:
+            image_path = f"imgs/imgs_servants/{servant['image_file']}"
+            sha1 = (file_sha1(image_path) if servant['image_file'] else None) or ''
+            fingerprint.update(f"{servant['id_num']}:{servant['image_file']}:{sha1}\n".encode())
+        fingerprint = fingerprint.hexdigest()
+
+        previous = sprite_map['sheets'][index // per_sheet] if index // per_sheet < len(sprite_map['sheets']) else None
+        if previous is None or previous['fingerprint'] != fingerprint or not os.path.exists(path):
+            pbar.set_postfix_str(sheet_file)
+            make_sprite_sheet(path, sheet_servants)
+        sheets.append({'file' : os.path.relpath(path, 'imgs'), 'fingerprint' : fingerprint})
+
+        for slot, servant in enumerate(sheet_servants):
+            sprites[str(servant['id_num'])] = {
+                'sheet' : index // per_sheet,
+                'x' : (slot % SPRITE_COLUMNS) * SPRITE_SIZE,
+                'y' : (slot // SPRITE_COLUMNS) * SPRITE_SIZE,
+                'width' : SPRITE_SIZE,
+                'height' : SPRITE_SIZE,
+            }
+
+    # Delete sheets left over from when there were more servants
+    for sheet in sprite_map['sheets'][len(sheets):]:
+        if os.path.exists(f"imgs/{sheet['file']}"):
+            os.remove(f"imgs/{sheet['file']}")
+
+    with open(SPRITE_MAP_FILE + '.tmp', 'w') as f:
+        json.dump({'sheets' : sheets, 'sprites' : sprites}, f, indent=2)
+    os.replace(SPRITE_MAP_FILE + '.tmp', SPRITE_MAP_FILE)
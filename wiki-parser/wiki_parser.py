@@ -1,42 +1,85 @@
 import argparse
+from wiki_fetch import *
 from wiki_servants import *
 from wiki_banners import *
 from wiki_images import *
 
-# Create the parser
-parser = argparse.ArgumentParser(description="Parse FGO wiki.")
-
-# Add the optional argument
-parser.add_argument('--servants', action='store_true',
-                    help='parse servant list before parsing banners')
-parser.add_argument('--banners', action='store_true',
-                    help='parse banners')
-parser.add_argument('--images', action='store_true',
-                    help='download images')
-
-# Parse the arguments
-args = parser.parse_args()
-
-# If the --update_servants argument was given, parse the servants
-if args.servants:
-    parse_servants()
-    write_to_json()
-
-if args.banners:
-    banner_init()
-    event_set_na = parse_and_create(EVENT_LIST_NA, "NA")
-    event_set_jp = parse_and_create(EVENT_LIST_JP, "JP")
-
-    # Create the JSON representation for event data
-    print("Creating event JSON data...")
-    create_event_json(event_set_jp, event_set_na)
-    print("Creating banner JSON data...")
-    create_banner_json(event_set_jp, event_set_na)
-    print("Creating servant JSON data...")
-    create_servant_json(event_set_jp, event_set_na)
-
-if args.images:
-    print("Downloading images...")
-    image_init()
-    download_event_images()
-    download_servant_images()
+def main():
+    # Create the parser
+    parser = argparse.ArgumentParser(description="Parse FGO wiki.")
+
+    # Add the optional argument
+    parser.add_argument('--servants', action='store_true',
+                        help='parse servant list before parsing banners')
+    parser.add_argument('--banners', action='store_true',
+                        help='parse banners')
+    parser.add_argument('--images', action='store_true',
+                        help='download images')
+    parser.add_argument('--variants', action='store_true',
+                        help='create resized copies of new or changed images')
+    parser.add_argument('--sprites', action='store_true',
+                        help='pack servant faces into sprite sheets')
+    parser.add_argument('--jobs', type=int, default=None, metavar='N',
+                        help='number of processes to parse servant pages and create image variants with (default: all cores)')
+    parser.add_argument('--timings', action='store_true',
+                        help='report the time spent on each wiki page when parsing banners')
+    parser.add_argument('--incremental', action='store_true',
+                        help='only reparse event lists with pages changed since the last banner build')
+    recording = parser.add_mutually_exclusive_group()
+    recording.add_argument('--record', metavar='DIR',
+                           help='record every wiki and HTTP response into DIR')
+    recording.add_argument('--replay', metavar='DIR',
+                           help='replay the wiki and HTTP responses recorded in DIR without contacting the wiki')
+
+    # Parse the arguments
+    args = parser.parse_args()
+
+    # Set up the page cache and any recording or replaying of responses
+    fetch_init(record_dir=args.record, replay_dir=args.replay)
+
+    # If the --update_servants argument was given, parse the servants
+    if args.servants:
+        parse_servants(args.jobs)
+        write_to_json()
+
+    if args.banners:
+        banner_init(args.timings)
+        # Recordings and replays are always full builds so every page is recorded
+        state = load_banner_state(args.incremental and not (args.record or args.replay))
+        event_set_na = parse_and_create(EVENT_LIST_NA, "NA", state)
+        event_set_jp = parse_and_create(EVENT_LIST_JP, "JP", state)
+
+        # Create the JSON representation for event data
+        print("Creating event JSON data...")
+        create_event_json(event_set_jp, event_set_na)
+        print("Creating banner JSON data...")
+        create_banner_json(event_set_jp, event_set_na)
+        print("Creating servant JSON data...")
+        create_servant_json(event_set_jp, event_set_na)
+
+        # Save the state of the build for the next incremental build
+        save_banner_state()
+
+        if args.timings:
+            report_timings()
+
+    # Save the responses of the run
+    save_recording()
+
+    if args.images:
+        print("Downloading images...")
+        image_init()
+        download_event_images()
+        download_servant_images()
+
+    if args.variants:
+        print("Creating image variants...")
+        create_image_variants(args.jobs)
+
+    if args.sprites:
+        print("Creating servant sprite sheets...")
+        create_servant_sprites()
+
+# Only run when executed as a script, since the worker processes of the servant parser and image variants may import this module
+if __name__ == '__main__':
+    main()
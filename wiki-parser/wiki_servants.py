@@ -1,26 +1,35 @@
-import pywikibot
 import mwparserfromhell
 import jsons
 import json
 import os
 import re
-import requests
+import sys
+from concurrent.futures import ProcessPoolExecutor
 from tqdm import tqdm
+from wiki_fetch import category_members, fetch_file, fetch_init, get_page, load_pages, save_page_cache
 
 BAR_FORMAT_SERVANTS = "{l_bar}{bar:50}{r_bar}{bar:-50b}"
 
 CATEGORY = 'Servant ID Order'
 
+# Atlas Academy export with the data of every servant
+ATLAS_ACADEMY_URL = 'https://api.atlasacademy.io/export/JP/nice_servant.json'
+
+# Find and replaces applied to every field of the servant details, in order
 FILTERS = {
-    # \n -> ', '
-    r'<br/>\\n': r', ', 
+    # {{Custom Kanji|jin}} -> 神
+    r'{{Custom Kanji\|jin}}': r'神',
+    # 𝘛𝘰𝘣𝘪 𝘒𝘢𝘵ō -> Tobi Kato
+    r'𝘛𝘰𝘣𝘪 𝘒𝘢𝘵ō': r'Tobi Kato',
+    # <br/>\n -> ', '
+    r'<br/>\n': r', ', 
     # \n<!-- DO NOT Remove. This is Used for Dynamic Servant Filter. --->, <!--Do not remove-->, <br/>, <sup>...?...</sup> -> ''
-    r'\\n<!--.*?-->|<!--.*?-->|<sup>.*?\?.*?</sup>': r'', 
+    r'\n<!--.*?-->|<!--.*?-->|<sup>.*?\?.*?</sup>': r'', 
     # \n -> ', '
-    r'\\n|<br/>': r', ', 
-    # [[w:c:typemoon:Shirou Emiya|Emiya Shirou]] -> Shirou Emiya
+    r'\n|<br/>': r', ', 
+    # '''Saber''' -> Saber
     r'\'\'\'(.*?)\'\'\'': r'\1', 
-    # [[w:c:typemoon:Shirou Emiya|Emiya Shirou]] -> Shirou Emiya
+    # [[w:c:typemoon:Shirou Emiya|Emiya Shirou]] -> Emiya Shirou
     r'\[\[:*w:c:[Tt]ypemoon:.*?\|(.*?)\]\]': r'\1', 
     # [[Iskandar|Young Iskandar]] -> Young Iskandar
     r'\[\[[^\]]*?\|(.*?)\]\]': r'\1', 
@@ -34,24 +43,29 @@ FILTERS = {
     r'{{[Tt]ooltip(?:\|.*?)?\|(?:2=)?(.*?)}}': r'\1', 
     # {{nihongo|King of Knights|騎士王|Kishi-ō}} -> King of Knights
     r'{{[Nn]ihongo\|(.*?)(\|.*?}}|}})': r'\1', 
-    # <span class=\"spoiler-msg\">Fairy Knight Galahad</span> -> [Fairy Knight Galahad]
-    r'<span class=\\\"spoiler-msg\\\">(.*?)</span>': r'[\1]'
+    # <span class="spoiler-msg">Fairy Knight Galahad</span> -> [Fairy Knight Galahad]
+    r'<span class="spoiler-msg">(.*?)</span>': r'[\1]'
 }
 
-def json_filter(json_str):
-    # {{Custom Kanji|jin}} -> 神
-    json_str = json_str.replace(r'{{Custom Kanji|jin}}', r'\u795e')
-    # 𝘛𝘰𝘣𝘪 𝘒𝘢𝘵ō -> Tobi Katō (replace surrogate pair character)
-    json_str = json_str.replace(
-        r'\ud835\ude1b\ud835\ude30\ud835\ude23\ud835\ude2a \ud835\ude12\ud835\ude22\ud835\ude35\u014d',
-        r'Tobi Kato'
-    )
-    # Apply regex find and replaces
-    for filter in FILTERS:
-        json_str = re.compile(filter).sub(FILTERS[filter], json_str)
-    # \" -> \\" (running .encode and .decode unescapes ")
-    json_str = json_str.replace(r'\"', r'\\"')
-    return json_str
+# The filters compiled once. Fields can span several lines, so . also matches newlines.
+FILTER_RULES = [(re.compile(pattern, re.DOTALL), replacement) for pattern, replacement in FILTERS.items()]
+
+def json_filter(obj):
+    """
+    Apply the filters to every string in the dumped servant details, before they are serialized.
+
+    Args:
+        obj: The dumped servant details
+    """
+    if isinstance(obj, str):
+        for pattern, replacement in FILTER_RULES:
+            obj = pattern.sub(replacement, obj)
+        return obj
+    if isinstance(obj, list):
+        return [json_filter(item) for item in obj]
+    if isinstance(obj, dict):
+        return {key : json_filter(value) for key, value in obj.items()}
+    return obj
 
 class Servant:
     def __init__(self, title, template):
@@ -75,22 +89,90 @@ class Servant:
 SERVANT_LIST = []
 ATLAS_ACADEMY_DATA = None
 
+def iter_json_array(f, chunk_size=1024 * 1024):
+    """
+    Yield the elements of a JSON array one at a time while reading the file incrementally,
+    so only the element being decoded is ever held in memory.
+
+    Args:
+        f: File containing a JSON array
+        chunk_size: Number of characters read from the file at a time
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    pos = 0
+    eof = False
+    # What comes next: '[' to start the array, the first element or ']', an element after a comma, or ',' or ']'
+    expected = 'start'
+    while True:
+        # Skip the whitespace before the next token, reading more of the file if needed
+        while pos < len(buffer) and buffer[pos] in ' \t\r\n':
+            pos += 1
+        if pos == len(buffer):
+            if eof:
+                raise ValueError('Expected a JSON array' if expected == 'start' else 'Unexpected end of JSON array')
+            chunk = f.read(chunk_size)
+            eof = not chunk
+            buffer = buffer[pos:] + chunk
+            pos = 0
+            continue
+
+        if expected == 'start':
+            if buffer[pos] != '[':
+                raise ValueError('Expected a JSON array')
+            pos += 1
+            expected = 'first'
+        # Elements are separated by exactly one comma
+        elif expected == 'separator':
+            if buffer[pos] == ']':
+                return
+            if buffer[pos] != ',':
+                raise ValueError(f"Expected ',' or ']' at position {pos} of the buffer")
+            pos += 1
+            expected = 'element'
+        # Stop at the end of an empty array
+        elif expected == 'first' and buffer[pos] == ']':
+            return
+        else:
+            # Decode the next element, reading more of the file if the element may be cut off.
+            # An element is only complete once it is followed by whitespace, ',' or ']', so numbers like 1.5 aren't
+            # cut short at the end of a chunk.
+            try:
+                element, end = decoder.raw_decode(buffer, pos)
+                if not eof and (end == len(buffer) or buffer[end] not in ' \t\r\n,]'):
+                    raise json.JSONDecodeError('Element may be cut off', buffer, end)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                chunk = f.read(chunk_size)
+                eof = not chunk
+                buffer = buffer[pos:] + chunk
+                pos = 0
+                continue
+            pos = end
+            expected = 'separator'
+            yield element
+
 def fetch_atlas_academy_data():
     """
-    Fetch and cache the servant data from Atlas Academy API.
+    Fetch and cache the ascension face images of every servant from Atlas Academy API.
+    The export is streamed one servant at a time and only the face images are kept.
     """
     global ATLAS_ACADEMY_DATA
     if ATLAS_ACADEMY_DATA is None:
         try:
             print('Fetching servant data from Atlas Academy API...')
-            response = requests.get('https://api.atlasacademy.io/export/JP/nice_servant.json', timeout=30)
-            response.raise_for_status()
-            # Map by collectionNo instead of id
-            ATLAS_ACADEMY_DATA = {servant.get('collectionNo'): servant for servant in response.json() if servant.get('collectionNo') is not None}
+            ATLAS_ACADEMY_DATA = {}
+            with open(fetch_file(ATLAS_ACADEMY_URL, timeout=30), encoding='utf-8') as f:
+                for servant in iter_json_array(f):
+                    # Map by collectionNo instead of id
+                    if servant.get('collectionNo') is not None:
+                        ATLAS_ACADEMY_DATA[servant['collectionNo']] = servant.get('extraAssets', {}).get('faces', {}).get('ascension', {})
             print(f'Successfully loaded data for {len(ATLAS_ACADEMY_DATA)} servants')
+        # Stop instead of writing servants without images if there is no good copy of the data
         except Exception as e:
             print(f"Error fetching Atlas Academy data: {e}")
-            ATLAS_ACADEMY_DATA = {}
+            sys.exit(1)
     return ATLAS_ACADEMY_DATA
 
 def get_servant_thumbnail(servant_id, servants_data):
@@ -100,15 +182,12 @@ def get_servant_thumbnail(servant_id, servants_data):
     
     Args:
         servant_id: The servant's collection number
-        servants_data: Pre-fetched Atlas Academy servant data dictionary
+        servants_data: Pre-fetched Atlas Academy ascension face images, keyed by collection number
     """
     # Match servant_id with collectionNo field
     if servant_id in servants_data:
-        servant = servants_data[servant_id]
         # Get the face images for ascensions
-        extra_assets = servant.get('extraAssets', {})
-        faces = extra_assets.get('faces', {})
-        ascension_faces = faces.get('ascension', {})
+        ascension_faces = servants_data[servant_id]
         
         # Return the first ascension face image filename
         if '1' in ascension_faces:
@@ -126,55 +205,125 @@ def get_servant_thumbnail(servant_id, servants_data):
     
     return ""
 
-def parse_servants():
+# Start of the template containing the servant details
+CHARACTERS_NEW_START = re.compile(r'{{\s*CharactersNew\s*(?=\||}})')
+BRACE_TOKENS = re.compile(r'<!--|{{|}}')
+
+def find_characters_new(text):
+    """
+    Find the first CharactersNew template by scanning the braces around it, and parse only that template.
+    Returns None if the end of the template can't be found, so the whole page needs to be parsed instead.
+
+    Args:
+        text: The wikitext of the page
+    """
+    for match in CHARACTERS_NEW_START.finditer(text):
+        start = match.start()
+        # Skip templates that are commented out
+        comment = text.rfind('<!--', 0, start)
+        if comment != -1 and text.find('-->', comment, start) == -1:
+            continue
+
+        # Find the closing braces matching the opening braces of the template, ignoring braces in comments
+        depth = 0
+        pos = start
+        while True:
+            token = BRACE_TOKENS.search(text, pos)
+            if token is None:
+                return None
+            pos = token.end()
+            if token.group() == '<!--':
+                end = text.find('-->', pos)
+                if end == -1:
+                    return None
+                pos = end + 3
+            elif token.group() == '{{':
+                depth += 1
+            else:
+                depth -= 1
+                if depth == 0:
+                    break
+
+        # The span should parse into exactly the one template, otherwise the braces were misread
+        templates = mwparserfromhell.parse(text[start:pos]).filter_templates(recursive=False)
+        if len(templates) != 1 or str(templates[0]) != text[start:pos]:
+            return None
+        return templates[0]
+    return None
+
+def parse_servant_page(title, text):
+    """
+    Parse the servant details out of a servant page. Runs in a worker process.
+    Returns the servant, or None and the reason it couldn't be parsed.
+
+    Args:
+        title: The title of the page
+        text: The wikitext of the page
+    """
+    # Parse only the template containing the servant details, falling back to parsing the whole page
+    template = find_characters_new(text)
+    templates = [template] if template else mwparserfromhell.parse(text).filter_templates()
+
+    # Find the template containing the servant details
+    for template in templates:
+        if template.name.strip() == 'CharactersNew':
+            # Find the ID of the servant
+            try:
+                id_val = template.get("id").value.strip()
+            except ValueError:
+                return None, f'No ID found for {title}'
+            # If the ID is valid, export the servant's data
+            if id_val.isdigit():
+                return Servant(title, template), None
+            return None, f'No ID found for {title}'
+    return None, None
+
+def parse_servants(jobs=None):
+    """
+    Parse the details of every servant, spreading the parsing of the pages across worker processes.
+
+    Args:
+        jobs: The number of worker processes (all cores if None, no workers if 1)
+    """
     print('Parsing servants...')
+    fetch_init()
     # Fetch Atlas Academy data once at the beginning
     servants_data = fetch_atlas_academy_data()
     
-    # Load the servants page
-    site = pywikibot.Site()
-    category = pywikibot.Category(site, CATEGORY)
-    category_length = len(list(category.articles()))
-
-    # Iterate through each servant's page.
-    for page in (pbar := tqdm(category.articles(), total=category_length, bar_format=BAR_FORMAT_SERVANTS)):
-        # Get name of servant
-        title = page.title()
-        pbar.set_postfix_str(title)
-        # Skip if (Arcade) is in title
-        if "(Arcade)" in title:
-            continue
-        # Parse servant info
-        text = page.text
-        wikicode = mwparserfromhell.parse(text)
-
-        # Find the template containing the servant details
-        filtered = wikicode.filter_templates()
-        for template in filtered:
-            if template.name.strip() == 'CharactersNew':
-                # Find the ID of the servant
-                id_val = 0
-                try:
-                    id_val = template.get("id").value.strip()
-                except ValueError:
-                    pbar.clear()
-                    print(f'No ID found for {title}')
-                    break
-                # If the ID is valid, export the servant's data
-                if id_val.isdigit():
-                    servant = Servant(title, template)
-                    # Get thumbnail image from pre-fetched Atlas Academy data
-                    servant.image_file = get_servant_thumbnail(servant.id, servants_data)
-                    SERVANT_LIST.append(servant)
-                else:
-                    pbar.clear()
-                    print(f'No ID found for {title}')
-                break
+    # Walk the category once and keep the titles of the servant pages, skipping arcade servants
+    titles = [title for title in category_members(CATEGORY) if "(Arcade)" not in title]
+
+    # Download the servant pages in batches before parsing any of them
+    load_pages(titles)
+
+    texts = [get_page(title).text for title in titles]
+
+    # Parse the pages on a pool of workers, collecting the servants in category order
+    executor = ProcessPoolExecutor(max_workers=jobs) if jobs != 1 else None
+    try:
+        results = executor.map(parse_servant_page, titles, texts, chunksize=8) if executor else map(parse_servant_page, titles, texts)
+        for title, (servant, error) in (pbar := tqdm(zip(titles, results), total=len(titles), bar_format=BAR_FORMAT_SERVANTS)):
+            pbar.set_postfix_str(title)
+            if error:
+                pbar.clear()
+                print(error)
+            if servant:
+                # Get thumbnail image from pre-fetched Atlas Academy data
+                servant.image_file = get_servant_thumbnail(servant.id, servants_data)
+                SERVANT_LIST.append(servant)
+    finally:
+        if executor:
+            executor.shutdown()
+
+    # Save the page cache so the next run only downloads pages that changed
+    save_page_cache()
 
 def write_to_json():
     print('Writing servant data to JSON...')
     # Save to JSON file
     with open(os.path.join(os.path.dirname(__file__), 'servant_details.json'), 'w') as f:
-        json_obj = jsons.dump(SERVANT_LIST)
+        json_str = json.dumps(json_filter(jsons.dump(SERVANT_LIST)), indent=2)
+        # \" -> \\" (running .encode and .decode unescapes ")
+        json_str = json_str.replace(r'\"', r'\\"')
         # Convert unicode \uXXXX to actual characters
-        f.write(json_filter(json.dumps(json_obj, indent=2)).encode().decode('unicode-escape'))
+        f.write(json_str.encode().decode('unicode-escape'))